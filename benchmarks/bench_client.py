@@ -0,0 +1,165 @@
+"""
+Measures connection, polling and command latency of NespressoClient against the
+simulated machine, and fails when one of them needs more round trips than its
+budget.
+
+    python benchmarks/bench_client.py --latency 0.03 --jitter 0.01 --loss 0.01
+
+Budgets are only checked on a lossless link, retries make the other runs vary
+too much to compare.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'nespresso'))
+
+from simulator import SimulatedNespresso
+from machines import BrewType
+from nespresso import NespressoClient
+from operations import PRIORITY_POLL, OperationQueue
+
+AUTH_KEY = 'e37d7534af63435d'
+
+# p95 in ATT round trips, connects on top of the connect latency. The first
+# connect pairs and onboards and isn't budgeted, it waits for the machine.
+BUDGETS = {
+    'connect': 3.0,
+    'poll': 1.5,
+    'brew command': 3.5,
+    'brew, polling': 3.5,
+}
+
+
+def summarise(name: str, samples: list) -> float | None:
+    """Prints the statistics of a measurement and returns its p95."""
+    if not samples:
+        print(f'{name:<14} no successful samples')
+        return None
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f'{name:<14} n={len(samples):<4} '
+          f'mean={statistics.mean(samples) * 1000:8.1f}ms '
+          f'p50={statistics.median(samples) * 1000:8.1f}ms '
+          f'p95={p95 * 1000:8.1f}ms')
+    return p95
+
+
+async def timed(samples: list, coro) -> object:
+    start = time.perf_counter()
+    result = await coro
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+async def run(args) -> dict:
+    machine = SimulatedNespresso(auth_key=AUTH_KEY,
+                                 latency=args.latency,
+                                 jitter=args.jitter,
+                                 connect_latency=args.connect_latency,
+                                 packet_loss=args.loss,
+                                 disconnect_rate=args.disconnect_rate,
+                                 brew_duration=0,
+                                 seed=args.seed)
+    client = NespressoClient(AUTH_CODE=AUTH_KEY, mac=machine.address,
+                             connector=machine.establish_connection)
+    client.isOnboard = True
+
+    pairs, connects, polls, brews = [], [], [], []
+    for attempt in range(args.connects):
+        await client.disconnect()
+        try:
+            await timed(connects if attempt else pairs, client.connect(machine.device))
+        except Exception as e:
+            print(f'connect failed: {e}')
+
+    async with client.session(machine.device):
+        await client.get_info()
+        await client.get_sensors()
+        for _ in range(args.iterations):
+            if await timed(polls, client.get_sensor_data()) is None:
+                polls.pop()
+        for _ in range(args.iterations):
+            response = await timed(brews, client.brew_predefined(BrewType.LUNGO))
+            if response != 'Done':
+                brews.pop()
+            await asyncio.sleep(0)
+
+    # Brews queued while something polls back to back, like an aggressive scan interval
+    queue = OperationQueue(machine.address)
+    contended = []
+
+    async def poll():
+        async with client.session(machine.device):
+            queue.mark_preemptible()
+            return await client.get_sensor_data()
+
+    async def poll_forever():
+        while True:
+            await asyncio.gather(*(queue.submit(poll, PRIORITY_POLL, key='poll')
+                                   for _ in range(args.pollers)), return_exceptions=True)
+
+    async def brew():
+        async with client.session(machine.device):
+            return await client.brew_predefined(BrewType.LUNGO)
+
+    poller = asyncio.create_task(poll_forever())
+    for _ in range(args.iterations):
+        await asyncio.sleep(args.latency * 3)
+        if await timed(contended, queue.submit(brew)) != 'Done':
+            contended.pop()
+    poller.cancel()
+    await queue.shutdown()
+
+    await client.disconnect()
+
+    summarise('pair', pairs)
+    results = {
+        'connect': summarise('connect', connects),
+        'poll': summarise('poll', polls),
+        'brew command': summarise('brew command', brews),
+        'brew, polling': summarise('brew, polling', contended),
+    }
+    print('machine counters:', machine.counters)
+    return results
+
+
+def check_budgets(args, results: dict) -> bool:
+    """Prints every measurement against its budget. Returns False if one is over."""
+    round_trip = args.latency + args.jitter
+    passed = True
+    for name, p95 in results.items():
+        if p95 is None:
+            continue
+        offset = args.connect_latency + args.jitter if name == 'connect' else 0.0
+        budget = offset + BUDGETS[name] * round_trip
+        over = p95 > budget
+        passed &= not over
+        print(f'{name:<14} p95={p95 * 1000:8.1f}ms  budget {budget * 1000:8.1f}ms  {"OVER" if over else "ok"}')
+    return passed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.03, help='seconds per ATT round trip')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--connect-latency', type=float, default=0.5)
+    parser.add_argument('--loss', type=float, default=0.0, help='packet loss probability')
+    parser.add_argument('--disconnect-rate', type=float, default=0.0)
+    parser.add_argument('--connects', type=int, default=3)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--pollers', type=int, default=4, help='concurrent pollers while measuring brews')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    if args.loss or args.disconnect_rate:
+        return 0
+    print()
+    return 0 if check_budgets(args, results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
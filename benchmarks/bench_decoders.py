@@ -0,0 +1,141 @@
+"""
+Micro-benchmarks for the frame decoders.
+
+Every decoder is timed over a representative frame corpus and its throughput
+(frames decoded per second, best of several rounds) is compared with the stored
+baseline. The run fails if any decoder is slower than its baseline by more than
+the tolerance.
+
+    python benchmarks/bench_decoders.py              # compare with the baseline
+    python benchmarks/bench_decoders.py --update     # store new baseline numbers
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'nespresso'))
+
+import commandResponse
+import errorInformation
+import machineState
+from machineStatus import BaseDecode, MachineStatus
+from machines import decode_machine_information
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baselines', 'decoders.json')
+
+STATE_FRAMES = [
+    bytearray(b'A\x84\x7f\xec\x00\x00\xff\xff'),    # brewing, water empty
+    bytearray(b'@\x02\x00\x00\x00\x00\xff\xff'),    # ready
+    bytearray(b'@\t\x0b\xe0\xc0\x00\xff\xff'),      # power save
+    bytearray(b'D\x01\x00\x00\x00\x00\x00\x12'),    # heat up, descaling needed
+    bytearray(b'P\x08\x00\x20\x00\x00\x00\x00'),    # error, capsule jammed
+]
+CAPS_FRAMES = [bytearray(b'\x00\x64'), bytearray(b'\xff\xff'), bytearray(b'\x00\x00')]
+SLIDER_FRAMES = [bytearray(b'\x00'), bytearray(b'\x02')]
+WATER_HARDNESS_FRAMES = [bytearray(b'\x02\x1c\x04\x00'), bytearray(b'\x02\x1c\x02\x00')]
+CMDRESP_FRAMES = [
+    bytearray(b'\x83\x05\x02\x20' + bytes(16)),
+    bytearray(b'\xc3\x05\x02$\x12' + bytes(15)),
+    bytearray(b'\xc3\x05\x02$\x08' + bytes(15)),
+    bytearray(b'\xc3\x05\x026\x00' + bytes(15)),
+]
+ERROR_FRAMES = [
+    bytearray(b'\x010&\x03\x04C\x97\xa4\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'),
+    bytearray(b'\x05\x12\x00\x07' + bytes(15)),
+]
+INFO_FRAMES = [bytearray(bytes.fromhex('00c8006500c80186a0d1e1037c4a9d'))]
+
+state_decoder = BaseDecode(name="state", format_type='state')
+caps_decoder = BaseDecode(name="caps_number", format_type='caps_number')
+slider_decoder = BaseDecode(name="slider", format_type='slider')
+water_hardness_decoder = BaseDecode(name="water_hardness", format_type='water_hardness')
+
+DECODERS = {
+    'MachineStatus.decode': (lambda frame: MachineStatus(frame).decode(), STATE_FRAMES),
+    'BaseDecode.state': (state_decoder.decode_data, STATE_FRAMES),
+    'BaseDecode.caps_number': (caps_decoder.decode_data, CAPS_FRAMES),
+    'BaseDecode.slider': (slider_decoder.decode_data, SLIDER_FRAMES),
+    'BaseDecode.water_hardness': (water_hardness_decoder.decode_data, WATER_HARDNESS_FRAMES),
+    'machineState.from_byte_array': (machineState.from_byte_array, STATE_FRAMES),
+    'commandResponse.from_byte_buffer': (commandResponse.from_byte_buffer, CMDRESP_FRAMES),
+    'errorInformation.to_error_information': (errorInformation.to_error_information, ERROR_FRAMES),
+    'machines.decode_machine_information': (decode_machine_information, INFO_FRAMES),
+}
+
+
+def measure(decoder, frames, min_time: float, rounds: int) -> float:
+    """Returns the best throughput in frames per second over the given number of rounds."""
+    # Calibrate the loop count so a round takes roughly min_time
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            for frame in frames:
+                decoder(frame)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 10:
+            break
+        loops *= 2
+    loops = max(1, int(loops * min_time / elapsed))
+
+    best = 0.0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(loops):
+            for frame in frames:
+                decoder(frame)
+        elapsed = time.perf_counter() - start
+        best = max(best, loops * len(frames) / elapsed)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--update', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed fractional slowdown before a decoder counts as regressed')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per measurement round')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--filter', default='', help='only run decoders containing this string')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    for name, (decoder, frames) in DECODERS.items():
+        if args.filter not in name:
+            continue
+        results[name] = measure(decoder, frames, args.min_time, args.rounds)
+        line = f'{name:<40} {results[name]:>12,.0f} frames/s'
+        if name in baseline:
+            ratio = results[name] / baseline[name]
+            line += f'   {ratio:6.2f}x baseline'
+            if ratio < 1 - args.tolerance:
+                regressions.append(name)
+                line += '   REGRESSION'
+        print(line)
+
+    if args.update:
+        baseline.update({name: round(value) for name, value in results.items()})
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline written to {args.baseline}')
+        return 0
+
+    if regressions:
+        print(f'{len(regressions)} decoder(s) slower than baseline: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
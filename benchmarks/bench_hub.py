@@ -0,0 +1,58 @@
+"""
+Measures how polling several simulated machines scales with adapter slots.
+
+    python benchmarks/bench_hub.py --machines 6 --adapters 2 --slots 3
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'nespresso'))
+
+from simulator import SimulatedNespresso
+from hub import NespressoHub
+from nespresso import NespressoClient, sensors_characteristics
+
+AUTH_KEY = 'e37d7534af63435d'
+
+
+async def run(args) -> None:
+    hub = NespressoHub(default_slots=args.slots)
+    devices = {}
+    for index in range(args.machines):
+        address = f'DF:81:37:AD:93:{index:02X}'
+        machine = SimulatedNespresso(address=address, auth_key=AUTH_KEY, latency=args.latency,
+                                     connect_latency=args.connect_latency, seed=index)
+        machine.device.details['source'] = f'hci{index % args.adapters}'
+        client = hub.add_client(NespressoClient(AUTH_CODE=AUTH_KEY, mac=address, idle_timeout=None,
+                                                connector=machine.establish_connection))
+        client.isOnboard = True
+        client.sensors = {address: list(sensors_characteristics)}
+        devices[address] = machine.device
+
+    for label in ('cold', 'warm'):
+        start = time.perf_counter()
+        results = await hub.poll_all(devices)
+        elapsed = time.perf_counter() - start
+        failed = sum(isinstance(result, Exception) for result in results.values())
+        print(f'{label:<5} poll of {args.machines} machines on {args.adapters} adapter(s) '
+              f'with {args.slots} slot(s) each: {elapsed:.2f}s ({failed} failed)')
+
+    for client in hub.clients.values():
+        await client.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--machines', type=int, default=6)
+    parser.add_argument('--adapters', type=int, default=2)
+    parser.add_argument('--slots', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.03)
+    parser.add_argument('--connect-latency', type=float, default=0.5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Replays recorded frames through the decoders and the sensor entities.
+
+Frames come from a frame log written by the record_frames option, or from a
+synthetic day of use when no log is given. With Home Assistant installed every
+decoded update is also pushed through the real NespressoSensor update path.
+
+    python benchmarks/bench_replay.py --log <config>/nespresso/frames/df8137ad9383
+    python benchmarks/bench_replay.py --days 30 --timeline
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'custom_components', 'nespresso'))
+
+from framelog import FrameLog
+from nespresso import CHAR_UUID_NBCAPS, CHAR_UUID_SLIDER, CHAR_UUID_STATE, CHAR_UUID_WATER_HARDNESS
+from replay import FrameReplay
+
+READY = b'@\x02\x00\x00\x00\x00\xff\xff'
+HEAT_UP = b'@\x01\x00\x00\x00\x00\xff\xff'
+BREWING = b'@\x04\x00\x00\x00\x00\xff\xff'
+POWER_SAVE = b'@\t\x0b\xe0\xc0\x00\xff\xff'
+
+
+def synthetic_frames(days: int, start: float = 1_700_000_000.0):
+    """A poll every minute of a machine brewing a few coffees a day."""
+    caps = 100
+    for day in range(days):
+        for minute in range(24 * 60):
+            timestamp = start + (day * 24 * 60 + minute) * 60
+            if minute % 240 == 120:
+                state = HEAT_UP
+            elif minute % 240 in (121, 122):
+                state = BREWING
+            elif minute % 240 == 123:
+                caps += 1
+                state = READY
+            elif minute % 240 < 140:
+                state = READY
+            else:
+                state = POWER_SAVE
+            yield timestamp, CHAR_UUID_STATE, state
+            yield timestamp, CHAR_UUID_NBCAPS, caps.to_bytes(2, 'big')
+            yield timestamp, CHAR_UUID_SLIDER, b'\x00'
+            yield timestamp, CHAR_UUID_WATER_HARDNESS, b'\x02\x1c\x02\x00'
+
+
+def entity_updater():
+    """Pushes snapshots through NespressoSensor, or returns None without Home Assistant."""
+    try:
+        sys.path.insert(0, ROOT)
+        from custom_components.nespresso.sensor import DEVICE_SENSOR_SPECIFICS, NespressoSensor
+    except ImportError:
+        return None, None
+
+    class ReplayCoordinator:
+        data = None
+        last_update_success = True
+
+    class ReplaySensor(NespressoSensor):
+        writes = 0
+
+        def async_write_ha_state(self):
+            ReplaySensor.writes += 1
+
+    coordinator = ReplayCoordinator()
+    sensors = [ReplaySensor(coordinator, '00:00:00:00:00:00', None, name, 'Replay', specifics, None)
+               for name, specifics in DEVICE_SENSOR_SPECIFICS.items()]
+
+    def update(timestamp, snapshot):
+        coordinator.data = snapshot
+        for sensor in sensors:
+            sensor._handle_coordinator_update()
+
+    return update, ReplaySensor
+
+
+async def run(args) -> None:
+    frames = FrameLog(args.log).scan() if args.log else synthetic_frames(args.days)
+    update, sensor_class = (None, None) if args.decoders_only else entity_updater()
+    replay = FrameReplay(frames, realtime=args.realtime, speed=args.speed, keep_timeline=args.timeline)
+    report = await replay.run(update)
+
+    if args.timeline:
+        for transition in report.timeline:
+            moment = datetime.fromtimestamp(transition.timestamp).isoformat(sep=' ', timespec='seconds')
+            print(f'{moment}  {transition.name:<28} {transition.old!s:>16} -> {transition.new}')
+        print()
+
+    if report.first_timestamp is not None:
+        span = report.last_timestamp - report.first_timestamp
+        print(f'{report.frames:,} frames over {span / 86400:.1f} recorded days')
+    print(f'decoded {report.decoded:,}, unchanged {report.unchanged:,}, errors {report.errors:,}, '
+          f'updates {report.updates:,}, command responses {len(report.command_responses):,}')
+    print(f'decode       {report.decode_time:8.3f}s {report.decode_throughput:>12,.0f} frames/s')
+    if update is not None:
+        print(f'entities     {report.update_time:8.3f}s {sensor_class.writes:>12,} state writes')
+    print(f'end to end   {report.decode_time + report.update_time:8.3f}s '
+          f'{report.end_to_end_throughput:>12,.0f} frames/s')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log', help='frame log directory to replay')
+    parser.add_argument('--days', type=int, default=7, help='days of synthetic frames without --log')
+    parser.add_argument('--realtime', action='store_true', help='replay at the recorded pace')
+    parser.add_argument('--speed', type=float, default=1.0, help='speed up factor of --realtime')
+    parser.add_argument('--timeline', action='store_true', help='print every value transition')
+    parser.add_argument('--decoders-only', action='store_true', help="don't update sensor entities")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Measures how long the integration takes to import and to set up, and fails
+when either is over its budget.
+
+Imports are timed in fresh interpreters, best of --repeat. The integration
+package is imported on top of the Home Assistant modules it uses, which are
+already loaded when Home Assistant sets it up, so only the integration's own
+cost is counted. Setup is timed on a real Home Assistant instance with a cached
+machine that isn't reachable, which is what every restart looks like.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --scale 4    # slower host, e.g. a Raspberry Pi
+"""
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+COMPONENT = os.path.join(ROOT, 'custom_components', 'nespresso')
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, COMPONENT)
+
+# Milliseconds on a desktop class host, multiplied by --scale
+BUDGETS = {
+    'import nespresso': 25.0,
+    'import integration': 25.0,
+    'setup from cache': 10.0,
+}
+
+# Modules that must stay out of an import, they are only needed once a machine is connected
+LAZY_MODULES = {
+    'import nespresso': ('bleak', 'bleak_retry_connector', 'pprint'),
+    'import integration': ('voluptuous_serialize', 'homeassistant.components.binary_sensor'),
+}
+
+# Already imported by Home Assistant and the bluetooth integration before this one loads
+HA_MODULES = (
+    'homeassistant.components.bluetooth',
+    'homeassistant.components.sensor',
+    'homeassistant.config_entries',
+    'homeassistant.helpers.config_validation',
+    'homeassistant.helpers.device_registry',
+    'homeassistant.helpers.entity_platform',
+    'homeassistant.helpers.event',
+    'homeassistant.helpers.restore_state',
+    'homeassistant.helpers.storage',
+    'homeassistant.helpers.update_coordinator',
+)
+
+IMPORT_SCRIPT = '''
+import sys, time
+sys.path[:0] = {path!r}
+import asyncio, logging
+{preload}
+before = set(sys.modules)
+start = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(' '.join(sorted(set(sys.modules) - before)))
+'''
+
+AUTH_KEY = 'e37d7534af63435d'
+
+
+def time_import(path: list, imports: str, preload: str = '') -> tuple:
+    """Seconds an import takes in a fresh interpreter and the modules it loaded."""
+    script = IMPORT_SCRIPT.format(path=path, preload=preload, imports=imports)
+    output = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True).stdout
+    elapsed, modules = output.splitlines()
+    return float(elapsed), modules.split()
+
+
+def has_home_assistant() -> bool:
+    try:
+        import homeassistant.core  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+async def read_identity() -> tuple:
+    """Address and device cache a first run against the simulated machine leaves behind."""
+    from nespresso import NespressoClient
+    from simulator import SimulatedNespresso
+
+    machine = SimulatedNespresso(auth_key=AUTH_KEY, latency=0, connect_latency=0, seed=0)
+    client = NespressoClient(AUTH_CODE=AUTH_KEY, mac=machine.address, connector=machine.establish_connection)
+    client.isOnboard = True
+    async with client.session(machine.device):
+        await client.get_info()
+        await client.get_sensors()
+        await client.get_sensor_data()
+    await client.disconnect()
+    return machine.address, client.export_identity()
+
+
+async def time_setup(repeat: int) -> float:
+    """Best time of the setup steps of async_setup_entry and the sensor platform, from the cache."""
+    sys.path.insert(0, ROOT)
+    from homeassistant.config_entries import ConfigEntries, ConfigEntry
+    from homeassistant.const import CONF_ADDRESS, CONF_TOKEN
+    from homeassistant.core import HomeAssistant
+    from homeassistant.helpers import area_registry as ar, device_registry as dr
+
+    from custom_components.nespresso import sensor
+    from custom_components.nespresso.const import DATA_HUB, DOMAIN, SCAN_INTERVAL
+    from custom_components.nespresso.coordinator import NespressoDataUpdateCoordinator, device_cache_store
+    from custom_components.nespresso.hub import NespressoHub
+    from custom_components.nespresso.nespresso import NespressoClient
+
+    mac, identity = await read_identity()
+    # The first refresh fails on purpose, the machine is out of reach
+    logging.getLogger('custom_components.nespresso').setLevel(logging.CRITICAL)
+    best = None
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+        hass.config_entries = ConfigEntries(hass, {})
+        await hass.config_entries.async_initialize()
+        await ar.async_load(hass)
+        await dr.async_load(hass)
+        coordinators = []
+        for _ in range(repeat):
+            entry = ConfigEntry(version=1, minor_version=1, domain=DOMAIN, title='Nespresso',
+                                data={CONF_ADDRESS: mac, CONF_TOKEN: AUTH_KEY}, source='user')
+            # Registered the way Home Assistant's own tests do, without setting it up
+            hass.config_entries._entries[entry.entry_id] = entry
+            await device_cache_store(hass, entry.entry_id).async_save(identity)
+            entities = []
+
+            # Everything async_setup_entry does short of following advertisements,
+            # which needs a bluetooth adapter
+            start = time.perf_counter()
+            hass.data.setdefault(DOMAIN, {})
+            hub = hass.data[DOMAIN].setdefault(DATA_HUB, NespressoHub())
+            client = NespressoClient(SCAN_INTERVAL, AUTH_KEY, mac)
+            hub.add_client(client)
+            coordinator = NespressoDataUpdateCoordinator(hass, entry, hub, client, mac)
+            await coordinator.async_load_device_cache()
+            hass.data[DOMAIN][entry.entry_id] = coordinator
+            entry.async_on_unload(client.add_state_listener(coordinator.async_handle_state_notification))
+            await sensor.async_setup_entry(hass, entry, entities.extend)
+            elapsed = time.perf_counter() - start
+
+            if not entities:
+                raise RuntimeError('no entities were created from the cache')
+            best = elapsed if best is None else min(best, elapsed)
+            coordinators.append(coordinator)
+            hub.remove_client(mac)
+
+        for coordinator in coordinators:
+            await coordinator.queue.shutdown()
+        await hass.async_stop(force=True)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='measurements per step, the best one counts')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply every budget by this factor')
+    args = parser.parse_args()
+
+    results = {}
+    best, modules = min(time_import([COMPONENT], 'import nespresso') for _ in range(args.repeat))
+    results['import nespresso'] = best, modules
+
+    if has_home_assistant():
+        preload = '\n'.join(f'import {module}' for module in HA_MODULES)
+        imports = 'import custom_components.nespresso, custom_components.nespresso.sensor'
+        best, modules = min(time_import([ROOT], imports, preload) for _ in range(args.repeat))
+        results['import integration'] = best, modules
+        results['setup from cache'] = asyncio.run(time_setup(args.repeat)), []
+    else:
+        print('Home Assistant is not installed, only timing the standalone modules')
+
+    failed = False
+    for name, (elapsed, modules) in results.items():
+        budget = BUDGETS[name] * args.scale
+        eager = [module for module in modules
+                 if any(module == lazy or module.startswith(lazy + '.') for lazy in LAZY_MODULES.get(name, ()))]
+        over = elapsed * 1000 > budget
+        failed |= over or bool(eager)
+        print(f'{name:<20} {elapsed * 1000:7.1f}ms  budget {budget:6.1f}ms  {"OVER" if over else "ok"}')
+        if modules:
+            print(f'{"":<20} {len(modules)} modules loaded')
+        if eager:
+            print(f'{"":<20} imports {", ".join(eager)} eagerly')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,357 @@
+"""
+In-process simulation of a Nespresso machine's GATT peripheral.
+
+SimulatedNespresso emulates the characteristics the integration uses (state, caps,
+slider, water hardness, device info, serial, auth, onboarding, brew and CMDRESP)
+including authentication, onboarding and a simple brew state progression.
+Latency, packet loss and spontaneous disconnects can be configured so connection,
+polling and command performance can be measured without a machine or an adapter.
+
+Pass SimulatedNespresso.establish_connection as the connector of a NespressoClient:
+
+    machine = SimulatedNespresso(auth_key='e37d7534af63435d', latency=0.03)
+    client = NespressoClient(AUTH_CODE=machine.auth_key, mac=machine.address,
+                             connector=machine.establish_connection)
+    async with client.session(machine.device):
+        ...
+"""
+import asyncio
+import binascii
+import os
+import random
+import sys
+from dataclasses import dataclass, field
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'nespresso'))
+
+from bleak.exc import BleakError
+
+from enums import MachineState
+from nespresso import (CHAR_UUID_AUTH, CHAR_UUID_BREW, CHAR_UUID_CMDRESP,
+                       CHAR_UUID_DEVICE_NAME, CHAR_UUID_INFO, CHAR_UUID_NBCAPS,
+                       CHAR_UUID_ONBOARD_STATUS, CHAR_UUID_PAIR, CHAR_UUID_SERIAL,
+                       CHAR_UUID_SLIDER, CHAR_UUID_STATE, CHAR_UUID_WATER_HARDNESS)
+
+# Characteristics that can only be used after a successful auth write
+PROTECTED_CHARACTERISTICS = {CHAR_UUID_STATE, CHAR_UUID_NBCAPS, CHAR_UUID_SLIDER,
+                             CHAR_UUID_WATER_HARDNESS, CHAR_UUID_BREW, CHAR_UUID_CMDRESP}
+
+GATT_TABLE = {
+    CHAR_UUID_DEVICE_NAME: ['read'],
+    CHAR_UUID_SERIAL: ['read'],
+    CHAR_UUID_INFO: ['read'],
+    CHAR_UUID_ONBOARD_STATUS: ['read'],
+    CHAR_UUID_PAIR: ['write'],
+    CHAR_UUID_AUTH: ['write'],
+    CHAR_UUID_STATE: ['read', 'notify'],
+    CHAR_UUID_NBCAPS: ['read', 'write'],
+    CHAR_UUID_SLIDER: ['read', 'notify'],
+    CHAR_UUID_WATER_HARDNESS: ['read', 'write'],
+    CHAR_UUID_BREW: ['write'],
+    CHAR_UUID_CMDRESP: ['notify'],
+}
+
+RESPONSE_ACK = 0x20
+RESPONSE_CONDITIONS_NOT_FULFILLED = 0x24
+RESPONSE_OUT_OF_RANGE = 0x36
+CONDITION_INVALID_STATE = 1
+CONDITION_SLIDER_OPEN = 8
+
+
+@dataclass
+class SimulatedDevice:
+    """Stand-in for the BLEDevice Home Assistant hands to the client."""
+    address: str
+    name: str
+    details: dict = field(default_factory=dict)
+    rssi: int = -60
+
+
+@dataclass
+class SimulatedCharacteristic:
+    uuid: str
+    properties: list
+    handle: int
+
+
+class SimulatedServices:
+    def __init__(self, characteristics: dict) -> None:
+        self.characteristics = characteristics
+
+    def get_characteristic(self, specifier):
+        if isinstance(specifier, SimulatedCharacteristic):
+            return specifier
+        return self.characteristics.get(str(specifier).lower())
+
+
+class SimulatedNespresso:
+    """
+    A simulated machine.
+
+    Parameters:
+    latency (float): Seconds per ATT round trip.
+    jitter (float): Maximum random seconds added to every round trip.
+    connect_latency (float): Seconds to establish a connection.
+    packet_loss (float): Probability that a read or write fails.
+    disconnect_rate (float): Probability that the link drops on any operation.
+    brew_duration (float): Seconds a brew keeps the machine in BREWING.
+    seed (int): Seed for the random generator so runs can be repeated.
+    """
+
+    def __init__(self,
+                 name='Expert&Milk_SIM001',
+                 address='DF:81:37:AD:93:83',
+                 serial='SIM0000000001',
+                 auth_key=None,
+                 latency=0.0,
+                 jitter=0.0,
+                 connect_latency=0.0,
+                 packet_loss=0.0,
+                 disconnect_rate=0.0,
+                 brew_duration=0.5,
+                 seed=None) -> None:
+        self.name = name
+        self.address = address
+        self.serial = serial
+        self.auth_key = auth_key
+        self.latency = latency
+        self.jitter = jitter
+        self.connect_latency = connect_latency
+        self.packet_loss = packet_loss
+        self.disconnect_rate = disconnect_rate
+        self.brew_duration = brew_duration
+        self.random = random.Random(seed)
+
+        self.state = MachineState.READY
+        self.water_is_empty = False
+        self.descaling_needed = False
+        self.slider_closed = True
+        self.caps_number = 100
+        self.water_hardness = 2
+        self.custom_recipe = None
+        self.pairing_window_open = False
+        self.device = SimulatedDevice(address, name)
+        self.clients: list = []
+        self.in_flight = 0
+        self.counters = {'connects': 0, 'reads': 0, 'writes': 0, 'notifications': 0,
+                         'subscriptions': 0, 'lost': 0, 'disconnects': 0, 'max_in_flight': 0}
+
+        self.characteristics = {
+            uuid: SimulatedCharacteristic(uuid, properties, handle)
+            for handle, (uuid, properties) in enumerate(GATT_TABLE.items(), start=0x10)
+        }
+
+    @property
+    def onboarded(self) -> bool:
+        return self.auth_key is not None
+
+    async def establish_connection(self, client_class, device, name, disconnected_callback=None, **kwargs):
+        """Drop-in replacement for bleak_retry_connector.establish_connection."""
+        await self._delay(self.connect_latency)
+        client = SimulatedBleakClient(self, disconnected_callback)
+        self.clients.append(client)
+        self.counters['connects'] += 1
+        return client
+
+    # Frames
+
+    def read_frame(self, uuid: str, client) -> bytes:
+        if uuid in PROTECTED_CHARACTERISTICS and not client.authenticated:
+            raise BleakError('Insufficient authentication')
+        if uuid == CHAR_UUID_DEVICE_NAME:
+            return self.name.encode('utf-8')
+        if uuid == CHAR_UUID_SERIAL:
+            return self.serial.encode('utf-8')
+        if uuid == CHAR_UUID_ONBOARD_STATUS:
+            return bytes([2 if self.onboarded else 0])
+        if uuid == CHAR_UUID_INFO:
+            mac = bytes.fromhex(self.address.replace(':', ''))
+            return bytes.fromhex('00c8006500c80186') + mac
+        if uuid == CHAR_UUID_STATE:
+            return self.state_frame()
+        if uuid == CHAR_UUID_NBCAPS:
+            return self.caps_number.to_bytes(2, 'big')
+        if uuid == CHAR_UUID_SLIDER:
+            return bytes([int(self.slider_closed) << 1])
+        if uuid == CHAR_UUID_WATER_HARDNESS:
+            return bytes([0x02, 0x1c, self.water_hardness, 0x00])
+        raise BleakError(f'Characteristic {uuid} is not readable')
+
+    def state_frame(self) -> bytes:
+        frame = bytearray(8)
+        frame[0] = 0x40 | int(self.water_is_empty) | int(self.descaling_needed) << 2
+        frame[1] = self.state.value & 0x0F
+        frame[6:8] = b'\xff\xff'
+        return bytes(frame)
+
+    def write_frame(self, uuid: str, data: bytes, client) -> None:
+        if uuid == CHAR_UUID_PAIR:
+            self.pairing_window_open = data[:1] == b'\x01'
+            return
+        if uuid == CHAR_UUID_AUTH:
+            key = binascii.hexlify(bytes(data)).decode()
+            if not self.onboarded and self.pairing_window_open:
+                self.auth_key = key
+                self.pairing_window_open = False
+            client.authenticated = self.onboarded and key == self.auth_key
+            return
+        if uuid in PROTECTED_CHARACTERISTICS and not client.authenticated:
+            raise BleakError('Insufficient authentication')
+        if uuid == CHAR_UUID_NBCAPS:
+            self.caps_number = int.from_bytes(data, 'big')
+            self.notify(CHAR_UUID_NBCAPS)
+        elif uuid == CHAR_UUID_WATER_HARDNESS:
+            self.water_hardness = data[2]
+        elif uuid == CHAR_UUID_BREW:
+            self.respond(self.handle_brew_command(bytes(data)))
+        else:
+            raise BleakError(f'Characteristic {uuid} is not writable')
+
+    def handle_brew_command(self, command: bytes) -> bytes:
+        if command[:3] == bytes([1, 16, 8]):
+            self.custom_recipe = command
+            return command_response(RESPONSE_ACK)
+        if command[:4] != bytes([3, 5, 7, 4]):
+            return command_response(RESPONSE_OUT_OF_RANGE)
+        if not self.slider_closed:
+            return command_response(RESPONSE_CONDITIONS_NOT_FULFILLED, CONDITION_SLIDER_OPEN)
+        if self.state != MachineState.READY:
+            return command_response(RESPONSE_CONDITIONS_NOT_FULFILLED, CONDITION_INVALID_STATE)
+        self.start_brew()
+        return command_response(RESPONSE_ACK)
+
+    def start_brew(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.set_state(MachineState.BREWING)
+        loop.call_later(self.brew_duration, self.finish_brew)
+
+    def finish_brew(self) -> None:
+        self.caps_number = max(self.caps_number - 1, 0)
+        self.set_state(MachineState.READY)
+        self.notify(CHAR_UUID_NBCAPS)
+
+    def set_state(self, state: MachineState) -> None:
+        self.state = state
+        self.notify(CHAR_UUID_STATE)
+
+    def respond(self, frame: bytes) -> None:
+        # The response notification follows the write on the next connection event
+        asyncio.get_running_loop().call_later(self.latency, self._deliver, CHAR_UUID_CMDRESP, frame)
+
+    def notify(self, uuid: str) -> None:
+        for client in self.clients:
+            if client.is_connected and uuid in client.subscriptions:
+                self._deliver(uuid, self.read_frame(uuid, client), client)
+
+    def _deliver(self, uuid: str, frame: bytes, client=None) -> None:
+        for target in [client] if client else self.clients:
+            callback = target.subscriptions.get(uuid) if target.is_connected else None
+            if callback is None:
+                continue
+            if self.random.random() < self.packet_loss:
+                self.counters['lost'] += 1
+                continue
+            self.counters['notifications'] += 1
+            callback(self.characteristics[uuid], bytearray(frame))
+
+    # Link simulation
+
+    async def _delay(self, seconds: float) -> None:
+        seconds += self.random.uniform(0, self.jitter) if self.jitter else 0
+        if seconds:
+            await asyncio.sleep(seconds)
+
+    async def round_trip(self, client) -> None:
+        if not client.is_connected:
+            raise BleakError('Not connected')
+        # Operations waiting for the link at the same time, batched reads overlap
+        self.in_flight += 1
+        self.counters['max_in_flight'] = max(self.counters['max_in_flight'], self.in_flight)
+        try:
+            await self._delay(self.latency)
+        finally:
+            self.in_flight -= 1
+        if self.random.random() < self.disconnect_rate:
+            client.drop()
+            raise BleakError('Simulated disconnect')
+        if self.random.random() < self.packet_loss:
+            self.counters['lost'] += 1
+            raise BleakError('Simulated packet loss')
+
+
+def command_response(code: int, condition: int = 0) -> bytes:
+    """Builds a CMDRESP frame as decoded by commandResponse.from_byte_buffer."""
+    frame = bytearray(20)
+    frame[0:3] = b'\x83\x05\x02'
+    frame[3] = code
+    frame[4] = condition
+    return bytes(frame)
+
+
+class SimulatedBleakClient:
+    """The subset of BleakClient the integration uses, backed by a SimulatedNespresso."""
+
+    def __init__(self, machine: SimulatedNespresso, disconnected_callback=None) -> None:
+        self.machine = machine
+        self.address = machine.address
+        self.services = SimulatedServices(machine.characteristics)
+        self.subscriptions: dict = {}
+        self.authenticated = False
+        self._connected = True
+        self._disconnected_callback = disconnected_callback
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def _uuid(self, specifier) -> str:
+        characteristic = self.services.get_characteristic(specifier)
+        if characteristic is None:
+            raise BleakError(f'Characteristic {specifier} was not found')
+        return characteristic.uuid
+
+    async def pair(self, *args, **kwargs) -> bool:
+        await self.machine.round_trip(self)
+        return True
+
+    async def read_gatt_char(self, specifier, **kwargs) -> bytearray:
+        uuid = self._uuid(specifier)
+        await self.machine.round_trip(self)
+        self.machine.counters['reads'] += 1
+        return bytearray(self.machine.read_frame(uuid, self))
+
+    async def write_gatt_char(self, specifier, data, response=False) -> None:
+        uuid = self._uuid(specifier)
+        await self.machine.round_trip(self)
+        self.machine.counters['writes'] += 1
+        self.machine.write_frame(uuid, data, self)
+
+    async def start_notify(self, specifier, callback, **kwargs) -> None:
+        uuid = self._uuid(specifier)
+        await self.machine.round_trip(self)
+        if uuid in PROTECTED_CHARACTERISTICS and not self.authenticated:
+            raise BleakError('Insufficient authentication')
+        self.machine.counters['subscriptions'] += 1
+        self.subscriptions[uuid] = callback
+
+    async def stop_notify(self, specifier) -> None:
+        uuid = self._uuid(specifier)
+        await self.machine.round_trip(self)
+        self.subscriptions.pop(uuid, None)
+
+    async def disconnect(self) -> bool:
+        if self._connected:
+            await self.machine._delay(self.machine.latency)
+            self.drop()
+        return True
+
+    def drop(self) -> None:
+        """Drops the link, as the machine going out of range would."""
+        if not self._connected:
+            return
+        self._connected = False
+        self.subscriptions.clear()
+        self.machine.counters['disconnects'] += 1
+        self.machine.clients.remove(self)
+        if self._disconnected_callback:
+            self._disconnected_callback(self)
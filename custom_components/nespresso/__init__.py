@@ -1,11 +1,32 @@
 """The nespresso integration."""
 from __future__ import annotations
 
+from datetime import timedelta
+
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.const import CONF_ADDRESS, CONF_TOKEN, EVENT_HOMEASSISTANT_STOP, Platform
+from homeassistant.core import Event, HomeAssistant
+from homeassistant.helpers.event import async_track_time_interval
 
-from .const import DOMAIN
+from .const import (
+    CONF_IDLE_TIMEOUT,
+    CONF_PUSH_UPDATES,
+    CONF_RECORD_FRAMES,
+    DATA_HUB,
+    DEFAULT_IDLE_TIMEOUT,
+    DEFAULT_PUSH_UPDATES,
+    DEFAULT_RECORD_FRAMES,
+    DOMAIN,
+    FRAME_FLUSH_INTERVAL,
+    MAX_SCAN_INTERVAL,
+    SCAN_INTERVAL,
+)
+from .breaker import CircuitBreaker
+from .coordinator import NespressoDataUpdateCoordinator, device_cache_store
+from .framelog import FrameRecorder
+from .hub import NespressoHub
+from .nespresso import NespressoClient
+from .sensor import async_remove_services
 
 # TODO List the platforms that you want to support.
 # For your initial PR, limit it to 1 platform.
@@ -16,19 +37,69 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up nespresso from a config entry."""
 
     hass.data.setdefault(DOMAIN, {})
-    # TODO 1. Create API instance
-    # TODO 2. Validate the API connection (and authentication)
-    # TODO 3. Store an API object for your platforms to access
-    hass.data[DOMAIN][entry.entry_id] = entry.data
+    # One hub schedules the connections of every configured machine
+    hub = hass.data[DOMAIN].setdefault(DATA_HUB, NespressoHub())
+    mac = entry.data.get(CONF_ADDRESS)
+    idle_timeout = timedelta(seconds=entry.options.get(CONF_IDLE_TIMEOUT, DEFAULT_IDLE_TIMEOUT))
+    push_updates = entry.options.get(CONF_PUSH_UPDATES, DEFAULT_PUSH_UPDATES)
+    breaker = CircuitBreaker(SCAN_INTERVAL.total_seconds(), MAX_SCAN_INTERVAL.total_seconds())
+    client = NespressoClient(SCAN_INTERVAL, entry.data.get(CONF_TOKEN), mac,
+                             idle_timeout=idle_timeout, push_updates=push_updates, breaker=breaker)
+    hub.add_client(client)
+    if entry.options.get(CONF_RECORD_FRAMES, DEFAULT_RECORD_FRAMES):
+        _async_start_recorder(hass, entry, client)
+    coordinator = NespressoDataUpdateCoordinator(hass, entry, hub, client, mac)
+    await coordinator.async_load_device_cache()
+    hass.data[DOMAIN][entry.entry_id] = coordinator
+    entry.async_on_unload(client.add_state_listener(coordinator.async_handle_state_notification))
+    entry.async_on_unload(coordinator.async_start_advertisement_tracking())
+
+    async def _async_stop(event: Event) -> None:
+        """Release the BLE connection when Home Assistant stops."""
+        await client.disconnect()
+        if client.recorder is not None:
+            await hass.async_add_executor_job(client.recorder.flush)
+
+    entry.async_on_unload(hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _async_stop))
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
     return True
 
 
+def _async_start_recorder(hass: HomeAssistant, entry: ConfigEntry, client: NespressoClient) -> None:
+    """Record every frame of the machine, flushing to disk from the executor."""
+    folder = client.address.replace(":", "").lower()
+    client.recorder = recorder = FrameRecorder(hass.config.path(DOMAIN, "frames", folder))
+
+    async def _async_flush(*_) -> None:
+        await hass.async_add_executor_job(recorder.flush)
+
+    entry.async_on_unload(async_track_time_interval(hass, _async_flush, FRAME_FLUSH_INTERVAL))
+    # Writes whatever was recorded since the last flush once the entry unloads
+    entry.async_on_unload(lambda: hass.async_create_task(_async_flush()))
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
-        hass.data[DOMAIN].pop(entry.entry_id)
+        coordinator = hass.data[DOMAIN].pop(entry.entry_id)
+        coordinator.hub.remove_client(coordinator.mac)
+        await coordinator.queue.shutdown()
+        await coordinator.client.disconnect()
+        # The services are shared by every machine, they go with the last one
+        if not any(isinstance(other, NespressoDataUpdateCoordinator) for other in hass.data[DOMAIN].values()):
+            async_remove_services(hass)
 
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the cached device info of a deleted config entry."""
+    await device_cache_store(hass, entry.entry_id).async_remove()
+
+
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload the config entry when its options change."""
+    await hass.config_entries.async_reload(entry.entry_id)
@@ -0,0 +1,102 @@
+"""
+Declarative bit-field layouts for the machine's characteristics.
+
+A Layout lists the fields of a frame once. It's compiled into a single decode
+function that reads every field straight from the frame in one pass and returns
+a dict, without building intermediate objects or converting the whole frame to
+an int per field.
+
+Bit positions follow the two conventions used by the reverse engineered protocol:
+bit() uses the BYTEn.bitm notation (bit 0 is the least significant bit of the
+byte) while bits() counts from the most significant bit of the frame like
+select_bits() did.
+"""
+from enum import Enum
+from typing import NamedTuple
+
+
+class Field(NamedTuple):
+    name: str
+    start_bit: int | None   # MSB-first bit offset, None for whole bytes
+    length: int | None      # In bits, or bytes for byte ranges
+    convert: object = None  # None, bool or an Enum whose member names are returned
+    byte_start: int = 0
+    byte_end: int | None = None
+
+
+class _EnumNames(dict):
+    """Member names by value. Unknown values raise like Enum(value) would."""
+
+    def __init__(self, enum: type[Enum]) -> None:
+        super().__init__((member.value, member.name) for member in enum)
+        self.enum = enum
+
+    def __missing__(self, value):
+        raise ValueError(f'{value!r} is not a valid {self.enum.__qualname__}')
+
+
+def bit(name: str, byte: int, bit: int, convert=bool) -> Field:
+    """A single bit addressed as BYTE<byte>.bit<bit>."""
+    return Field(name, byte * 8 + 7 - bit, 1, convert)
+
+
+def bits(name: str, start_bit: int, length: int, convert=None) -> Field:
+    """length bits starting start_bit bits from the most significant bit of the frame."""
+    return Field(name, start_bit, length, convert)
+
+
+def byte_range(name: str, start: int, end: int | None = None, convert=None) -> Field:
+    """Big endian integer of frame[start:end]. Short frames are clipped like a slice."""
+    return Field(name, None, None, convert, start, end)
+
+
+class Layout:
+    def __init__(self, *fields: Field) -> None:
+        self.fields = fields
+        self.source, self.decode = self._compile()
+
+    def _compile(self):
+        namespace = {}
+        entries = []
+        single_bytes = set()
+        slices = False
+        for index, field in enumerate(self.fields):
+            if field.start_bit is None and field.byte_start == 0 and field.byte_end is None:
+                expression = "int.from_bytes(frame, 'big')"
+            elif field.start_bit is None:
+                slices = True
+                end = '' if field.byte_end is None else field.byte_end
+                expression = f"int.from_bytes(b[{field.byte_start}:{end}], 'big')"
+            else:
+                first = field.start_bit // 8
+                last = (field.start_bit + field.length - 1) // 8
+                shift = (last + 1) * 8 - field.start_bit - field.length
+                mask = (1 << field.length) - 1
+                if first == last:
+                    single_bytes.add(first)
+                    value = f'b{first}'
+                else:
+                    slices = True
+                    value = f"int.from_bytes(b[{first}:{last + 1}], 'big')"
+                if shift:
+                    value = f'({value} >> {shift})'
+                expression = f'({value} & {mask})'
+
+            if field.convert is bool:
+                expression = f'{expression} != 0'
+            elif isinstance(field.convert, type) and issubclass(field.convert, Enum):
+                namespace[f'_names{index}'] = _EnumNames(field.convert)
+                expression = f'_names{index}[{expression}]'
+            elif field.convert is not None:
+                namespace[f'_convert{index}'] = field.convert
+                expression = f'_convert{index}({expression})'
+            entries.append(f'        {field.name!r}: {expression},')
+
+        # Every byte shared by several fields is only indexed once
+        loads = ''.join(f'    b{index} = b[{index}]\n' for index in sorted(single_bytes))
+        # Multi-byte fields are sliced from a memoryview so the frame isn't copied
+        source = 'def decode(frame):\n' \
+                 f'    b = {"memoryview(frame)" if slices else "frame"}\n' + loads + \
+                 '    return {\n' + '\n'.join(entries) + '\n    }\n'
+        exec(compile(source, f'<layout {", ".join(f.name for f in self.fields)}>', 'exec'), namespace)
+        return source, namespace['decode']
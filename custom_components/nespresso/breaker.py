@@ -0,0 +1,72 @@
+"""
+Circuit breaker that stops connecting to a machine which is plainly unreachable.
+
+A machine that is switched off or out of range makes every connection attempt
+run into establish_connection's retries and timeouts, holding an adapter slot
+other BLE devices could use. After `threshold` consecutive failed attempts the
+breaker opens and further attempts are refused until a backoff has passed. The
+backoff doubles with every failure up to max_delay and is jittered so machines
+that dropped off together don't retry in lockstep. The first attempt after it
+passed is a trial: success closes the breaker, failure opens it for longer.
+reset() closes it right away, e.g. when the machine is seen advertising again.
+"""
+import random
+import time
+
+DEFAULT_THRESHOLD = 3
+DEFAULT_BASE_DELAY = 60.0
+DEFAULT_MAX_DELAY = 15 * 60.0
+# Fraction of the backoff that is randomised
+DEFAULT_JITTER = 0.25
+
+
+class CircuitBreaker:
+    def __init__(self, base_delay: float = DEFAULT_BASE_DELAY, max_delay: float = DEFAULT_MAX_DELAY,
+                 threshold: int = DEFAULT_THRESHOLD, jitter: float = DEFAULT_JITTER, clock=time.monotonic) -> None:
+        """
+        Parameters:
+        base_delay (float): Seconds refused after the breaker first opens.
+        max_delay (float): Upper bound of the backoff in seconds.
+        threshold (int): Consecutive failures that open the breaker.
+        jitter (float): Fraction of the backoff that is randomised.
+        clock (callable): Monotonic time in seconds.
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.threshold = threshold
+        self.jitter = jitter
+        self.failures = 0
+        self._clock = clock
+        self._retry_at = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self.failures >= self.threshold
+
+    @property
+    def retry_in(self) -> float:
+        """Seconds until the next attempt is allowed, 0 if it is allowed now."""
+        if not self.is_open:
+            return 0.0
+        return max(0.0, self._retry_at - self._clock())
+
+    def allow(self) -> bool:
+        return self.retry_in == 0.0
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._retry_at = 0.0
+
+    def record_failure(self) -> bool:
+        """Counts a failed attempt. Returns True if that opened the breaker."""
+        self.failures += 1
+        if not self.is_open:
+            return False
+        delay = min(self.base_delay * 2 ** min(self.failures - self.threshold, 16), self.max_delay)
+        delay *= 1 - self.jitter * random.random()
+        self._retry_at = self._clock() + delay
+        return self.failures == self.threshold
+
+    def reset(self) -> None:
+        """Closes the breaker without a successful attempt."""
+        self.record_success()
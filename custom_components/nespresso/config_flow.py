@@ -8,7 +8,7 @@ import voluptuous as vol
 
 from homeassistant import config_entries
 from homeassistant.const import CONF_ADDRESS, CONF_NAME, CONF_TOKEN
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.exceptions import HomeAssistantError
 import homeassistant.helpers.config_validation as cv
@@ -22,10 +22,16 @@ from homeassistant.components.bluetooth import (
 
 from .machines import supported
 from .nespresso import NespressoClient
-from bleak import BleakClient
-from bleak_retry_connector import establish_connection
 
-from .const import DOMAIN
+from .const import (
+    CONF_IDLE_TIMEOUT,
+    CONF_PUSH_UPDATES,
+    CONF_RECORD_FRAMES,
+    DEFAULT_IDLE_TIMEOUT,
+    DEFAULT_PUSH_UPDATES,
+    DEFAULT_RECORD_FRAMES,
+    DOMAIN,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -77,6 +83,14 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     VERSION = 1
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(
+        config_entry: config_entries.ConfigEntry,
+    ) -> config_entries.OptionsFlow:
+        """Get the options flow for this handler."""
+        return OptionsFlowHandler()
+
     async def async_step_bluetooth(
         self, discovery_info: BluetoothServiceInfo
     ) -> FlowResult:
@@ -187,6 +201,42 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         )
 
 
+class OptionsFlowHandler(config_entries.OptionsFlow):
+    """Handle nespresso options."""
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Manage the connection options."""
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        data_schema = vol.Schema(
+            {
+                vol.Optional(
+                    CONF_IDLE_TIMEOUT,
+                    default=self.config_entry.options.get(
+                        CONF_IDLE_TIMEOUT, DEFAULT_IDLE_TIMEOUT
+                    ),
+                ): vol.All(vol.Coerce(int), vol.Range(min=0, max=3600)),
+                vol.Optional(
+                    CONF_PUSH_UPDATES,
+                    default=self.config_entry.options.get(
+                        CONF_PUSH_UPDATES, DEFAULT_PUSH_UPDATES
+                    ),
+                ): cv.boolean,
+                vol.Optional(
+                    CONF_RECORD_FRAMES,
+                    default=self.config_entry.options.get(
+                        CONF_RECORD_FRAMES, DEFAULT_RECORD_FRAMES
+                    ),
+                ): cv.boolean,
+            }
+        )
+
+        return self.async_show_form(step_id="init", data_schema=data_schema)
+
+
 class CannotConnect(HomeAssistantError):
     """Error to indicate we cannot connect."""
 
@@ -1,3 +1,34 @@
 """Constants for the nespresso integration."""
+from datetime import timedelta
 
 DOMAIN = "nespresso"
+
+# hass.data[DOMAIN] key of the hub shared by all config entries
+DATA_HUB = "hub"
+
+SCAN_INTERVAL = timedelta(seconds=60)
+
+# Poll cadence while the machine reports one of these states, keyed by
+# MachineState name. Any other state polls every SCAN_INTERVAL.
+STATE_SCAN_INTERVALS = {
+    "HEAT_UP": timedelta(seconds=5),
+    "BREWING": timedelta(seconds=3),
+    "STEAM_OUT": timedelta(seconds=5),
+    "DESCALING": timedelta(seconds=15),
+    "POWER_SAVE": timedelta(minutes=5),
+}
+# Without an advertised change the machine is still read at least this often
+ADVERTISEMENT_MAX_AGE = timedelta(minutes=10)
+# Connection attempts to an unreachable machine back off from SCAN_INTERVAL up to this
+MAX_SCAN_INTERVAL = timedelta(minutes=15)
+
+CONF_IDLE_TIMEOUT = "idle_timeout"
+DEFAULT_IDLE_TIMEOUT = 30
+
+CONF_PUSH_UPDATES = "push_updates"
+DEFAULT_PUSH_UPDATES = False
+
+CONF_RECORD_FRAMES = "record_frames"
+DEFAULT_RECORD_FRAMES = False
+# Recorded frames are written to disk this often
+FRAME_FLUSH_INTERVAL = timedelta(seconds=60)
@@ -0,0 +1,342 @@
+"""DataUpdateCoordinator for the nespresso integration."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from homeassistant.components import bluetooth
+from homeassistant.components.bluetooth import async_ble_device_from_address
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .const import ADVERTISEMENT_MAX_AGE, DOMAIN, SCAN_INTERVAL, STATE_SCAN_INTERVALS
+from .hub import NespressoHub
+from .nespresso import CHAR_UUID_INFO, NespressoClient, NespressoConnectionError
+from .operations import PRIORITY_COMMAND, PRIORITY_POLL, OperationQueue
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+# RSSI changes smaller than this (dB) don't update the signal strength sensor
+RSSI_HYSTERESIS = 5
+
+
+def device_cache_store(hass: HomeAssistant, entry_id: str) -> Store:
+    """Return the store holding the cached machine identity of a config entry."""
+    return Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry_id}")
+
+
+class NespressoDataUpdateCoordinator(DataUpdateCoordinator[dict]):
+    """Poll a single machine and share the decoded data with all its entities.
+
+    Each refresh is exactly one read cycle over the shared client session
+    regardless of how many entities listen.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry, hub: NespressoHub, client: NespressoClient, mac: str) -> None:
+        """Initialize the coordinator."""
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=f"{DOMAIN} {mac}",
+            update_interval=SCAN_INTERVAL,
+            # Entities are only called back when a decoded value changed
+            always_update=False,
+        )
+        self.entry = entry
+        self.hub = hub
+        self.client = client
+        self.mac = mac
+        self.device_cache: dict | None = None
+        # Commands and reads of this machine run one at a time, commands first
+        self.queue = OperationQueue(mac)
+        self._store = device_cache_store(hass, entry.entry_id)
+        # The cached identity is verified against the firmware once per run
+        self._identity_checked = False
+        self._identity_stale = False
+        self._timed_polls = 0
+        # Passive advertisement tracking, see async_start_advertisement_tracking
+        self.present = True
+        self.rssi: int | None = None
+        self._reported_rssi: int | None = None
+        self._advertisement = None
+        # Advertised changes and commands since the start of the last successful read
+        self._changes = 0
+        self._polled_changes = 0
+        self._last_poll: float | None = None
+
+    def session(self):
+        """Open a session with the machine through the hub's slot scheduling."""
+        return self.hub.session(self.client, async_ble_device_from_address(self.hass, self.mac))
+
+    async def async_load_device_cache(self) -> dict | None:
+        """Restore the cached machine identity, if any, into the client."""
+        self.device_cache = await self._store.async_load()
+        if self.device_cache:
+            self.client.restore_identity(self.device_cache)
+        return self.device_cache
+
+    async def async_command(self, command, deadline: float | None = None):
+        """Run command(client) in a session ahead of any queued poll, preempting a connected one.
+
+        With a deadline (event loop time) queueing, connecting and the command
+        itself are cancelled once it passes, raising TimeoutError.
+        """
+        async def _run():
+            async with self.session():
+                return await command(self.client)
+
+        async with asyncio.timeout_at(deadline):
+            result = await self.queue.submit(_run, PRIORITY_COMMAND)
+        # Pick up the state the command put the machine in, e.g. brewing
+        self._changes += 1
+        self.hass.async_create_task(self.async_request_refresh())
+        return result
+
+    async def async_refresh_device_info(self) -> None:
+        """Read the identity, sensor list and data from the machine and cache them."""
+        await self.queue.submit(self._async_refresh_device_info, PRIORITY_POLL, key="device_info")
+
+    async def _async_refresh_device_info(self) -> None:
+        async with self.session():
+            await self._async_read_identity()
+            sensordata = await self.client.get_sensor_data()
+        if not sensordata or self.mac not in sensordata:
+            raise NespressoConnectionError(f'No sensor data received from {self.mac}')
+
+        await self._async_save_device_cache()
+        self._last_poll = time.monotonic()
+        self._adapt_update_interval(sensordata[self.mac])
+        self.async_set_updated_data(dict(sensordata[self.mac]))
+
+    @callback
+    def async_start_advertisement_tracking(self) -> CALLBACK_TYPE:
+        """Follow the machine's advertisements without connecting to it.
+
+        Presence, RSSI and the manufacturer and service data broadcast by the
+        machine are tracked from passive scans. Polls only connect when that
+        data changed, a command asked for fresh data, the machine is busy or
+        the last read is older than ADVERTISEMENT_MAX_AGE.
+        """
+        if (service_info := bluetooth.async_last_service_info(self.hass, self.mac, connectable=False)) is not None:
+            self.rssi = service_info.rssi
+            self._advertisement = _advertisement_signature(service_info)
+
+        remove_advertisement = bluetooth.async_register_callback(
+            self.hass,
+            self._async_handle_advertisement,
+            bluetooth.BluetoothCallbackMatcher(address=self.mac, connectable=False),
+            bluetooth.BluetoothScanningMode.PASSIVE,
+        )
+        remove_unavailable = bluetooth.async_track_unavailable(
+            self.hass, self._async_handle_unavailable, self.mac, connectable=False
+        )
+
+        @callback
+        def _remove() -> None:
+            remove_advertisement()
+            remove_unavailable()
+
+        return _remove
+
+    @callback
+    def _async_handle_advertisement(
+        self, service_info: bluetooth.BluetoothServiceInfoBleak, change: bluetooth.BluetoothChange
+    ) -> None:
+        self.rssi = service_info.rssi
+        if self._reported_rssi is None or abs(self.rssi - self._reported_rssi) >= RSSI_HYSTERESIS:
+            self._reported_rssi = self.rssi
+            self.async_update_listeners()
+
+        signature = _advertisement_signature(service_info)
+        returned = not self.present
+        self.present = True
+        if signature == self._advertisement and not returned:
+            return
+
+        if self._advertisement is not None or returned:
+            _LOGGER.debug("Advertisement of %s changed, refreshing", self.mac)
+            # The machine is back or doing something, worth connecting to despite recent failures
+            self.client.breaker.reset()
+            self._changes += 1
+            self.hass.async_create_task(self.async_request_refresh())
+        self._advertisement = signature
+
+    @callback
+    def _async_handle_unavailable(self, service_info: bluetooth.BluetoothServiceInfoBleak) -> None:
+        _LOGGER.debug("%s is no longer advertising", self.mac)
+        self.present = False
+        # Connected peripherals stop advertising, with push updates for good
+        if not self.client.is_connected:
+            self.async_set_update_error(UpdateFailed(f"{self.mac} is not advertising"))
+
+    def _needs_connection(self) -> bool:
+        """Whether the next poll has to read the machine or can reuse the last data."""
+        if self.data is None or self._last_poll is None or self._advertisement is None:
+            return True
+        if self._changes != self._polled_changes:
+            return True
+        # Brewing and heating progress isn't advertised
+        if self.update_interval is not None and self.update_interval < SCAN_INTERVAL:
+            return True
+        return time.monotonic() - self._last_poll >= ADVERTISEMENT_MAX_AGE.total_seconds()
+
+    async def _async_read_identity(self) -> None:
+        devices_info = await self.client.get_info()
+        # Nothing stale may be cached as if it had just been read
+        if devices_info is None or self.mac not in devices_info:
+            raise UpdateFailed(f'Could not read device info from {self.mac}')
+        for mac, dev in devices_info.items():
+            _LOGGER.info("{}: {}".format(mac, dev))
+
+        _LOGGER.debug("Getting sensors")
+        devices_sensors = await self.client.get_sensors()
+        for mac, sensors in devices_sensors.items():
+            for sensor in sensors:
+                _LOGGER.debug("{}: Found sensor UUID: {}".format(mac, sensor))
+
+        self._identity_checked = True
+        self._identity_stale = True
+
+    async def _async_check_identity(self) -> None:
+        """Re-read the identity if the machine firmware changed since it was cached."""
+        info = (await self.client.read_characteristics([CHAR_UUID_INFO]))[CHAR_UUID_INFO]
+        if isinstance(info, Exception):
+            return
+        self._identity_checked = True
+        if info.hex() != self.device_cache['device'].get('machine_information'):
+            _LOGGER.info("Firmware of %s changed, refreshing device info", self.mac)
+            await self._async_read_identity()
+
+    def _link_state_changed(self) -> bool:
+        """Whether the bond or onboarding state differ from the cache, the next start reconnects faster with them."""
+        return self.device_cache is not None and (
+            self.device_cache.get('bonded') != self.client.bonded
+            or self.device_cache.get('onboarded') != bool(self.client.isOnboard))
+
+    async def _async_save_device_cache(self) -> None:
+        previous = self.device_cache
+        self.device_cache = self.client.export_identity()
+        self._identity_stale = False
+        await self._store.async_save(self.device_cache)
+        self.async_update_device_registry()
+
+        if previous and previous['entities'] != self.device_cache['entities']:
+            _LOGGER.info("Sensors of %s changed, reloading", self.mac)
+            self.hass.config_entries.async_schedule_reload(self.entry.entry_id)
+
+    @callback
+    def async_update_device_registry(self) -> dr.DeviceEntry:
+        """Create or update the device registry entry from the known identity."""
+        dev = self.client.devices[self.mac]
+        return dr.async_get(self.hass).async_get_or_create(
+            config_entry_id=self.entry.entry_id,
+            connections={(dr.CONNECTION_NETWORK_MAC, self.mac)},
+            identifiers={(DOMAIN, self.mac)},
+            manufacturer="Nespresso",
+            suggested_area="Kitchen",
+            name=dev.name,
+            model=dev.model.name,
+            sw_version=dev.fw_version,
+            hw_version=dev.hw_version,
+            serial_number=dev.serial,
+        )
+
+    @callback
+    def async_handle_state_notification(self, mac: str, sensor_data: dict) -> None:
+        """Push a decoded GATT notification straight to the entities."""
+        if mac != self.mac or self.data is None:
+            return
+        data = {**self.data, **sensor_data}
+        if data != self.data:
+            self._adapt_update_interval(data)
+            self.async_set_updated_data(data)
+
+    def _adapt_update_interval(self, data: dict | None) -> None:
+        """Poll faster while the machine is busy and slower while it sleeps or is unreachable."""
+        if data is None:
+            # Retry once the circuit breaker lets the next connection attempt through
+            interval = timedelta(seconds=self.client.breaker.retry_in) or SCAN_INTERVAL
+        else:
+            interval = STATE_SCAN_INTERVALS.get(data.get("state"), SCAN_INTERVAL)
+        if interval != self.update_interval:
+            _LOGGER.debug("Polling %s every %s", self.mac, interval)
+            self.update_interval = interval
+
+    async def _async_update_data(self) -> dict:
+        """Fetch the latest sensor data from the machine.
+
+        Polls queued while another is waiting share its result and a connected
+        poll yields to user commands, restarting once they are done. The next
+        poll is scheduled according to the state the machine reported.
+        """
+        try:
+            data = await self.queue.submit(self._async_poll, PRIORITY_POLL, key="poll")
+        except UpdateFailed:
+            self._adapt_update_interval(None)
+            raise
+        self._adapt_update_interval(data)
+        polls = self.client.timings.count("poll")
+        if data == self.data and polls != self._timed_polls:
+            # Unchanged data isn't pushed to the entities but the timing sensors moved
+            self.async_update_listeners()
+        self._timed_polls = polls
+        return data
+
+    async def _async_poll(self) -> dict:
+        # An open connection shows the machine is there as well as an advertisement would
+        if not self.present and not self.client.is_connected:
+            raise UpdateFailed(f'{self.mac} is not advertising')
+        if not self._needs_connection():
+            _LOGGER.debug("Advertisement of %s unchanged, skipping connection", self.mac)
+            return self.data
+
+        ble_device = async_ble_device_from_address(self.hass, self.mac)
+        if ble_device is None and not self.client.is_connected:
+            raise UpdateFailed(f'{self.mac} is not reachable')
+
+        # Changes advertised while reading are picked up by the next poll
+        changes = self._changes
+
+        try:
+            async with self.hub.session(self.client, ble_device):
+                # Once connected a command can take over the link, not before
+                self.queue.mark_preemptible()
+                if self.device_cache is None:
+                    # First contact, the machine's identity decides which entities exist
+                    await self._async_read_identity()
+                elif not self._identity_checked:
+                    await self._async_check_identity()
+                sensordata = await self.client.get_sensor_data()
+        except UpdateFailed:
+            raise
+        except NespressoConnectionError as e:
+            raise UpdateFailed(str(e)) from e
+        except Exception as e:
+            raise UpdateFailed(f'Error communicating with {self.mac}: {e}') from e
+
+        if not sensordata or self.mac not in sensordata:
+            raise UpdateFailed(f'No sensor data received from {self.mac}')
+
+        # New decoded values (e.g. after a decoder update) need their entities created
+        new_entities = set(sensordata[self.mac]) - set(self.device_cache['entities']) if self.device_cache else set()
+        if self._identity_stale or new_entities or self._link_state_changed():
+            await self._async_save_device_cache()
+
+        self._polled_changes = changes
+        self._last_poll = time.monotonic()
+        return dict(sensordata[self.mac])
+
+
+def _advertisement_signature(service_info: bluetooth.BluetoothServiceInfoBleak) -> tuple:
+    """The advertised payload, without the RSSI which changes on every packet."""
+    return (
+        tuple(sorted(service_info.manufacturer_data.items())),
+        tuple(sorted(service_info.service_data.items())),
+        tuple(sorted(service_info.service_uuids)),
+    )
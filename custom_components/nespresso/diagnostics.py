@@ -0,0 +1,72 @@
+"""Diagnostics support for the nespresso integration."""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_ADDRESS, CONF_TOKEN
+from homeassistant.core import HomeAssistant
+
+from . import commandResponse
+from .const import DOMAIN
+from .coordinator import NespressoDataUpdateCoordinator
+from .nespresso import CHAR_UUID_CMDRESP, CHAR_UUID_INFO, sensor_decoders
+
+TO_REDACT = {CONF_ADDRESS, CONF_TOKEN, "auth_code", "serial", "mac_address", "machine_information"}
+
+
+def _timestamp(value: float) -> str:
+    return datetime.fromtimestamp(value, timezone.utc).isoformat()
+
+
+def _command_result(frame: bytes) -> str:
+    try:
+        return commandResponse.from_byte_buffer(frame).value
+    except Exception as e:  # Undecodable responses are exactly what diagnostics are for
+        return f"undecodable: {e}"
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator: NespressoDataUpdateCoordinator = hass.data[DOMAIN][entry.entry_id]
+    client = coordinator.client
+
+    frames = {}
+    for char_uuid, ring in client.frame_history.items():
+        if char_uuid == CHAR_UUID_CMDRESP or not len(ring):
+            continue
+        name = sensor_decoders[char_uuid].name if char_uuid in sensor_decoders else char_uuid
+        frames[name] = {
+            "uuid": char_uuid,
+            "received": ring.count,
+        }
+        # The device info frames carry the machine's address and identity
+        if char_uuid != CHAR_UUID_INFO:
+            frames[name]["frames"] = [{"time": _timestamp(at), "data": frame.hex()} for at, frame in ring.frames()]
+
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "device": async_redact_data(coordinator.device_cache or {}, TO_REDACT),
+        "data": coordinator.data,
+        "last_update_success": coordinator.last_update_success,
+        "update_interval": str(coordinator.update_interval),
+        "connection": {
+            "connected": client.is_connected,
+            "present": coordinator.present,
+            "rssi": coordinator.rssi,
+            "notifying": sorted(client._notifying),
+            "failed_attempts": client.breaker.failures,
+            "retry_in": client.breaker.retry_in,
+        },
+        "timings": {
+            **client.timings.summary(),
+            "history": {phase: histogram.samples() for phase, histogram in client.timings.phases.items()},
+        },
+        "frames": frames,
+        "command_responses": [
+            {"time": _timestamp(at), "data": frame.hex(), "result": _command_result(frame)}
+            for at, frame in client.frame_history[CHAR_UUID_CMDRESP].frames()
+        ],
+    }
@@ -0,0 +1,48 @@
+"""
+Fixed memory history of the raw frames received from a machine.
+
+Each characteristic gets a FrameRing that preallocates room for its last
+`capacity` frames up front. Appending copies the frame into the next slot, so
+the history can stay enabled permanently without growing or churning memory.
+"""
+import time
+from array import array
+
+DEFAULT_CAPACITY = 32
+# Frames never exceed the 20 byte payload of the default ATT MTU
+DEFAULT_FRAME_SIZE = 20
+
+
+class FrameRing:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, frame_size: int = DEFAULT_FRAME_SIZE) -> None:
+        self.capacity = capacity
+        self.frame_size = frame_size
+        self._data = bytearray(capacity * frame_size)
+        self._view = memoryview(self._data)
+        self._lengths = array('H', bytes(2 * capacity))
+        self._timestamps = array('d', bytes(8 * capacity))
+        self._next = 0
+        self.count = 0
+
+    def append(self, frame, timestamp: float | None = None) -> None:
+        """Stores a frame, overwriting the oldest once full. Longer frames are truncated."""
+        length = min(len(frame), self.frame_size)
+        offset = self._next * self.frame_size
+        self._view[offset:offset + length] = frame[:length] if length < len(frame) else frame
+        self._lengths[self._next] = length
+        self._timestamps[self._next] = time.time() if timestamp is None else timestamp
+        self._next = (self._next + 1) % self.capacity
+        self.count += 1
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def frames(self) -> list:
+        """The stored (timestamp, bytes) pairs, oldest first."""
+        start = self._next if self.count >= self.capacity else 0
+        result = []
+        for i in range(len(self)):
+            slot = (start + i) % self.capacity
+            offset = slot * self.frame_size
+            result.append((self._timestamps[slot], bytes(self._data[offset:offset + self._lengths[slot]])))
+        return result
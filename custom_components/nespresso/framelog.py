@@ -0,0 +1,209 @@
+"""
+Compact on-disk log of the raw frames exchanged with a machine.
+
+A log is a directory of append-only segments. Each segment holds records of
+
+    timestamp (int64, microseconds since the epoch)
+    characteristic id (uint8, see CHARACTERISTIC_IDS)
+    length (uint8)
+    frame bytes
+
+after a short header, so a state frame takes 18 bytes on disk. Every
+INDEX_INTERVAL records the timestamp and offset of the record are added to the
+segment's index file, which readers memory-map to seek to a point in time
+without reading the segment up to it. Segments are named after their first
+timestamp and a new one is started once SEGMENT_SIZE is reached.
+
+FrameRecorder.record() only appends to memory and is cheap enough to call for
+every frame from the event loop. flush() does the file I/O and is meant to be
+run in an executor.
+"""
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    from .nespresso import (CHAR_UUID_CMDRESP, CHAR_UUID_INFO, CHAR_UUID_NBCAPS, CHAR_UUID_SLIDER,
+                            CHAR_UUID_STATE, CHAR_UUID_WATER_HARDNESS)
+except ImportError:
+    from nespresso import (CHAR_UUID_CMDRESP, CHAR_UUID_INFO, CHAR_UUID_NBCAPS, CHAR_UUID_SLIDER,
+                           CHAR_UUID_STATE, CHAR_UUID_WATER_HARDNESS)
+
+MAGIC = b'NSPF'
+VERSION = 1
+HEADER = struct.Struct('<4sB3x')
+RECORD = struct.Struct('<qBB')
+INDEX_ENTRY = struct.Struct('<qI')
+
+SEGMENT_SIZE = 4 * 1024 * 1024
+INDEX_INTERVAL = 64
+
+# Stored in place of the UUIDs. Ids are never reused, new characteristics get new ones.
+CHARACTERISTIC_IDS = {
+    CHAR_UUID_STATE: 1,
+    CHAR_UUID_NBCAPS: 2,
+    CHAR_UUID_SLIDER: 3,
+    CHAR_UUID_WATER_HARDNESS: 4,
+    CHAR_UUID_INFO: 5,
+    CHAR_UUID_CMDRESP: 6,
+}
+CHARACTERISTIC_UUIDS = {char_id: char_uuid for char_uuid, char_id in CHARACTERISTIC_IDS.items()}
+
+
+def _segment_name(timestamp_us: int) -> str:
+    return f'{timestamp_us:016x}'
+
+
+class FrameRecorder:
+    def __init__(self, directory: str, segment_size: int = SEGMENT_SIZE) -> None:
+        self.directory = directory
+        self.segment_size = segment_size
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._index = bytearray()
+        # Finished segments not written yet as (name, data, index)
+        self._pending_segments: list = []
+        self._segment: str | None = None
+        # Size the current segment will have once the buffer is flushed
+        self._offset = 0
+        self._records = 0
+
+    def record(self, char_uuid: str, frame, timestamp: float | None = None) -> None:
+        """Queues a frame for the next flush. Frames of unknown characteristics are ignored."""
+        char_id = CHARACTERISTIC_IDS.get(char_uuid)
+        if char_id is None:
+            return
+        timestamp_us = int((time.time() if timestamp is None else timestamp) * 1_000_000)
+        length = min(len(frame), 255)
+        with self._lock:
+            if self._segment is None or self._offset + RECORD.size + length > self.segment_size:
+                self._start_segment(timestamp_us)
+            if self._records % INDEX_INTERVAL == 0:
+                self._index += INDEX_ENTRY.pack(timestamp_us, self._offset)
+            self._buffer += RECORD.pack(timestamp_us, char_id, length)
+            self._buffer += frame[:length]
+            self._offset += RECORD.size + length
+            self._records += 1
+
+    def _start_segment(self, timestamp_us: int) -> None:
+        if self._segment is not None:
+            self._pending_segments.append((self._segment, bytes(self._buffer), bytes(self._index)))
+            self._buffer.clear()
+            self._index.clear()
+        self._segment = _segment_name(timestamp_us)
+        self._buffer += HEADER.pack(MAGIC, VERSION)
+        self._offset = HEADER.size
+        self._records = 0
+
+    def flush(self) -> None:
+        """Writes the queued frames to disk. Blocking, run it in an executor."""
+        with self._lock:
+            pending = self._pending_segments
+            self._pending_segments = []
+            if self._segment is not None and self._buffer:
+                pending.append((self._segment, bytes(self._buffer), bytes(self._index)))
+                self._buffer.clear()
+                self._index.clear()
+        if not pending:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for segment, data, index in pending:
+            path = os.path.join(self.directory, segment)
+            with open(path + '.seg', 'ab') as f:
+                f.write(data)
+            if index:
+                with open(path + '.idx', 'ab') as f:
+                    f.write(index)
+
+
+class FrameLog:
+    """Reads the frames a FrameRecorder wrote to a directory."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def segments(self) -> list:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(os.path.join(self.directory, name[:-4])
+                      for name in os.listdir(self.directory) if name.endswith('.seg'))
+
+    def scan(self, start: float | None = None, end: float | None = None, characteristics=None):
+        """
+        Yields the recorded frames in order.
+
+        Parameters:
+        start (float): Skip frames before this epoch timestamp.
+        end (float): Stop at frames after this epoch timestamp.
+        characteristics (iterable): Only yield frames of these characteristic UUIDs.
+
+        Returns:
+        Generator of (timestamp, characteristic UUID, bytes).
+        """
+        start_us = None if start is None else int(start * 1_000_000)
+        end_us = None if end is None else int(end * 1_000_000)
+        wanted = None if characteristics is None else {CHARACTERISTIC_IDS[c] for c in characteristics}
+
+        segments = self.segments()
+        if start_us is not None:
+            # The last segment starting at or before start is the first one needed
+            firsts = [int(os.path.basename(path), 16) for path in segments]
+            segments = segments[max(0, bisect.bisect_right(firsts, start_us) - 1):]
+
+        for path in segments:
+            if end_us is not None and int(os.path.basename(path), 16) > end_us:
+                return
+            for timestamp_us, char_id, frame in self._scan_segment(path, start_us):
+                if end_us is not None and timestamp_us > end_us:
+                    return
+                if start_us is not None and timestamp_us < start_us:
+                    continue
+                if wanted is None or char_id in wanted:
+                    yield timestamp_us / 1_000_000, CHARACTERISTIC_UUIDS.get(char_id, char_id), frame
+
+    def _scan_segment(self, path: str, start_us: int | None):
+        with open(path + '.seg', 'rb') as f:
+            if os.fstat(f.fileno()).st_size <= HEADER.size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, version = HEADER.unpack_from(data)
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError(f'{path}.seg is not a version {VERSION} frame log segment')
+                offset = HEADER.size
+                if start_us is not None:
+                    offset = self._seek(path, start_us) or offset
+                size = len(data)
+                while offset + RECORD.size <= size:
+                    timestamp_us, char_id, length = RECORD.unpack_from(data, offset)
+                    offset += RECORD.size
+                    if offset + length > size:
+                        # Torn write at the end of the segment
+                        return
+                    yield timestamp_us, char_id, data[offset:offset + length]
+                    offset += length
+
+    @staticmethod
+    def _seek(path: str, start_us: int) -> int | None:
+        """Offset of the last indexed record at or before start_us, from the mmapped index."""
+        try:
+            f = open(path + '.idx', 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            entries = os.fstat(f.fileno()).st_size // INDEX_ENTRY.size
+            if not entries:
+                return None
+            with mmap.mmap(f.fileno(), entries * INDEX_ENTRY.size, access=mmap.ACCESS_READ) as index:
+                low, high = 0, entries
+                while low < high:
+                    middle = (low + high) // 2
+                    if INDEX_ENTRY.unpack_from(index, middle * INDEX_ENTRY.size)[0] <= start_us:
+                        low = middle + 1
+                    else:
+                        high = middle
+                if low == 0:
+                    return None
+                return INDEX_ENTRY.unpack_from(index, (low - 1) * INDEX_ENTRY.size)[1]
@@ -0,0 +1,115 @@
+"""
+Schedules the connections of several machines over the available adapters.
+
+Each machine keeps its own NespressoClient. The hub bounds how many of them can
+be connected through one adapter at a time, which is what limits throughput
+when several machines share a couple of adapters or proxies, and runs the
+sessions of different machines concurrently up to that limit.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+try:
+    from .nespresso import NespressoClient
+except ImportError:
+    from nespresso import NespressoClient
+
+_LOGGER = logging.getLogger(__name__)
+
+# ESPHome Bluetooth proxies default to three connection slots and most local
+# adapters handle at least that many reliably
+DEFAULT_ADAPTER_SLOTS = 3
+DEFAULT_ADAPTER = 'default'
+
+
+def adapter_of(device) -> str:
+    """Returns the adapter (or proxy) Home Assistant routes a BLEDevice through."""
+    details = getattr(device, 'details', None)
+    if isinstance(details, dict) and details.get('source'):
+        return details['source']
+    return DEFAULT_ADAPTER
+
+
+class NespressoHub:
+    def __init__(self, default_slots: int = DEFAULT_ADAPTER_SLOTS, adapter_slots: dict | None = None) -> None:
+        """
+        Parameters:
+        default_slots (int): Concurrent connections allowed per adapter.
+        adapter_slots (dict): Overrides of default_slots keyed by adapter.
+        """
+        self.default_slots = default_slots
+        self.adapter_slots = dict(adapter_slots or {})
+        self.clients: dict = {}
+        self._client_adapters: dict = {}
+        self._semaphores: dict = {}
+
+    def add_client(self, client: NespressoClient) -> NespressoClient:
+        self.clients[client.address] = client
+        return client
+
+    def remove_client(self, address: str) -> None:
+        self.clients.pop(address, None)
+        self._client_adapters.pop(address, None)
+
+    def slots(self, adapter: str) -> int:
+        return self.adapter_slots.get(adapter, self.default_slots)
+
+    def _semaphore(self, adapter: str) -> asyncio.Semaphore:
+        if adapter not in self._semaphores:
+            self._semaphores[adapter] = asyncio.Semaphore(self.slots(adapter))
+        return self._semaphores[adapter]
+
+    @asynccontextmanager
+    async def session(self, client: NespressoClient, device):
+        """
+        Runs a client session once its adapter has a free connection slot.
+
+        Idle connections kept open by other machines on the same adapter are closed
+        if they would otherwise leave no slot for this one. A machine whose circuit
+        breaker is open is refused before it takes a slot or closes anything.
+        """
+        client.check_reachable()
+        # Keeps the adapter of a connected machine that is no longer advertised
+        if device is None:
+            adapter = self._client_adapters.get(client.address, DEFAULT_ADAPTER)
+        else:
+            adapter = adapter_of(device)
+        self._client_adapters[client.address] = adapter
+        async with self._semaphore(adapter):
+            if not client.is_connected:
+                await self._make_room(adapter, client)
+            async with client.session(device):
+                yield client
+
+    async def _make_room(self, adapter: str, client: NespressoClient) -> None:
+        connected = [other for address, other in self.clients.items()
+                     if other is not client and other.is_connected
+                     and self._client_adapters.get(address) == adapter]
+        # Active sessions are bounded by the semaphore, so enough of these are idle
+        idle = [other for other in connected if not other.in_use]
+        while idle and len(connected) >= self.slots(adapter):
+            other = idle.pop()
+            _LOGGER.debug(f'Closing idle connection to {other.address} to free a slot on {adapter}')
+            await other.disconnect()
+            connected.remove(other)
+
+    async def poll(self, client: NespressoClient, device):
+        async with self.session(client, device):
+            return await client.get_sensor_data()
+
+    async def poll_all(self, devices: dict) -> dict:
+        """
+        Polls several machines concurrently.
+
+        Parameters:
+        devices (dict): BLEDevice of each machine to poll keyed by address.
+
+        Returns:
+        dict: The sensor data, or the exception raised, keyed by address.
+        """
+        addresses = [address for address in devices if address in self.clients]
+        results = await asyncio.gather(
+            *(self.poll(self.clients[address], devices[address]) for address in addresses),
+            return_exceptions=True)
+        return dict(zip(addresses, results))
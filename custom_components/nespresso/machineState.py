@@ -1,4 +1,8 @@
 from enum import Enum
+try:
+    from bitfields import Layout, bit, bits
+except ImportError:
+    from .bitfields import Layout, bit, bits
 
 class MachineState(Enum):
     RESET = 0
@@ -33,28 +37,20 @@ def select_bits(byte_array, start_bit, length):
     mask = (1 << length) - 1
     return value & mask
 
-def from_byte_array(byte_array):
-    machine_state = MachineState(select_bits(byte_array, 12, 4))  # Adjusted to 4 bits based on the enum
-    #capsule_stock_low = get_boolean(byte_array, 16) Seems incorrect. Reversed from decompiled code.
-    capsule_stock_counter = select_bits(byte_array, 17, 10)  # 10 bits for the counter
-    programmed_brewing_active = get_boolean(byte_array, 27)
-    programmed_brew_event_counter = select_bits(byte_array, 28, 2)
-    capsule_stock_event_counter = select_bits(byte_array, 30, 2)
-    blocked_machine_event_counter = select_bits(byte_array, 32, 2)
-    #slider_open = not get_boolean(byte_array, 46) # Seems incorrect. Reversed from decompiled code.
-    #obstacle_detected = get_boolean(byte_array, 47) # Seems incorrect. Reversed from decompiled code.
+STATUS_LAYOUT = Layout(
+    bits('MachineState', 12, 4, MachineState),
+    #bit('CapsuleStockLow', 2, 7), Seems incorrect. Reversed from decompiled code.
+    bits('CapsuleStockCounter', 17, 10),  # 10 bits for the counter
+    bit('ProgrammedBrewingActive', 3, 3),
+    bits('ProgrammedBrewEventCounter', 28, 2),
+    bits('CapsuleStockEventCounter', 30, 2),
+    bits('BlockedMachineEventCounter', 32, 2),
+    #bit('SliderOpen', 5, 6), Seems incorrect. Reversed from decompiled code.
+    #bit('ObstacleDetected', 5, 7), Seems incorrect. Reversed from decompiled code.
+)
 
-    return {
-        'MachineState': machine_state.name,
-        #'CapsuleStockLow': capsule_stock_low,
-        'CapsuleStockCounter': capsule_stock_counter,
-        'ProgrammedBrewingActive': programmed_brewing_active,
-        'ProgrammedBrewEventCounter': programmed_brew_event_counter,
-        'CapsuleStockEventCounter': capsule_stock_event_counter,
-        'BlockedMachineEventCounter': blocked_machine_event_counter,
-        #'SliderOpen': slider_open,
-        #'ObstacleDetected': obstacle_detected
-    }
+def from_byte_array(byte_array):
+    return STATUS_LAYOUT.decode(byte_array)
 
 if __name__ == '__main__':
     # Test with the byte array
@@ -33,6 +33,16 @@ class CoffeeMachine:
         return f'Name: {self.name}\n' \
                f'Serial: {self.serial}'
 
+    def to_dict(self) -> dict:
+        """
+        Serialisable form of the machine for caching.
+
+        The model and configurations are left out, they are derived from the name again
+        by CoffeeMachineFactory.from_dict().
+        """
+        return {key: value for key, value in vars(self).items()
+                if key not in ('model', 'configurations')}
+
 class ExpertMachine(CoffeeMachine):
     def __init__(self, name: str, serial: str):
         super().__init__(MachineType.EXPERT, name, serial)
@@ -78,6 +88,13 @@ class CoffeeMachineFactory:
                 print(f"No specific machine found for model {model_name}. Using default.")
                 return CoffeeMachine(model_name)
 
+    @staticmethod
+    def from_dict(data: dict) -> CoffeeMachine:
+        machine = CoffeeMachineFactory.get_coffee_machine(data['name'], data['serial'])
+        for key, value in data.items():
+            setattr(machine, key, value)
+        return machine
+
 def get_error_message(error_code):
     try:
         return ErrorCode(error_code).name.replace('_', ' ').title()
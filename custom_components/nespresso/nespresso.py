@@ -1,24 +1,41 @@
+from __future__ import annotations
+
 import asyncio
-import pprint
-from bleak import BleakScanner, BleakClient, BLEDevice
-from bleak_retry_connector import establish_connection
+from typing import TYPE_CHECKING
 try:
     from .machines import CoffeeMachineFactory, MachineType, BrewType, Temprature, Ingredient, decode_machine_information, get_machine_type_from_model_name, decode_pairing_key_state
     from . import commandResponse, machineState, errorInformation
     from .machineStatus import BaseDecode
+    from .timings import PhaseTimings
+    from .framebuffer import FrameRing
+    from .breaker import CircuitBreaker
 except ImportError:
     from machines import CoffeeMachineFactory, MachineType, BrewType, Temprature, Ingredient, decode_machine_information, get_machine_type_from_model_name, decode_pairing_key_state
     import commandResponse, machineState, errorInformation
     from machineStatus import BaseDecode
+    from timings import PhaseTimings
+    from framebuffer import FrameRing
+    from breaker import CircuitBreaker
 from datetime import datetime, timedelta
 import binascii
+import time
 import uuid
 from collections import namedtuple
+from contextlib import asynccontextmanager
 import logging
 
+# bleak is only imported once a connection is made, decoding and replaying frames don't need it
+if TYPE_CHECKING:
+    from bleak import BleakClient, BLEDevice
+
 
 _LOGGER = logging.getLogger(__name__)
 
+
+class NespressoConnectionError(Exception):
+    """Raised when a session with the machine cannot be established."""
+
+
 CHAR_UUID_DEVICE_NAME = '00002a00-0000-1000-8000-00805f9b34fb'
 CHAR_UUID_MANUFACTURER_NAME = '00002a00-0000-1000-8000-00805f9b34fb'
 CHAR_UUID_STATE = '06aa3a12-f22a-11e3-9daa-0002a5d5c51b'
@@ -43,6 +60,13 @@ device_info_characteristics = [manufacturer_characteristics,
                                Characteristic(CHAR_UUID_INFO, 'device_info', "utf-8")]
 sensors_characteristics = [CHAR_UUID_STATE, CHAR_UUID_NBCAPS,
                            CHAR_UUID_SLIDER, CHAR_UUID_WATER_HARDNESS]
+# Subscribed to in push mode when the machine advertises notify/indicate support for them
+notify_characteristics = [CHAR_UUID_STATE, CHAR_UUID_NBCAPS, CHAR_UUID_SLIDER]
+
+COMMAND_ATTEMPTS = 3
+COMMAND_RESPONSE_TIMEOUT = 5
+# Budget of a command without an explicit deadline, enough for every attempt to time out
+COMMAND_TIMEOUT = COMMAND_ATTEMPTS * COMMAND_RESPONSE_TIMEOUT
 
 sensor_decoders = {CHAR_UUID_STATE:BaseDecode(name="state", format_type='state'),
                    CHAR_UUID_NBCAPS:BaseDecode(name="caps_number", format_type='caps_number'),
@@ -56,7 +80,12 @@ class NespressoClient():
                  scan_interval=timedelta(seconds=180), 
                  AUTH_CODE=None, 
                  mac=None, 
-                 device: BLEDevice = None
+                 device: BLEDevice = None,
+                 idle_timeout=timedelta(seconds=30),
+                 push_updates=False,
+                 concurrent_reads=True,
+                 connector=None,
+                 breaker: CircuitBreaker = None
                  ) -> None:
         self.nespresso_devices = [] if mac is None else [mac]
         self.auth_code = AUTH_CODE
@@ -68,58 +97,245 @@ class NespressoClient():
         self.command_response = None
         self.state_response = None
         self.isOnboard = None
+        # Paired and authenticated before, reconnects skip straight to auth
+        self.bonded = False
         self.machine: MachineType | None = None
+        self.devices: dict = {}
         self.address = mac
+        self.idle_timeout = idle_timeout
+        self.push_updates = push_updates
+        self.concurrent_reads = concurrent_reads
+        # establish_connection() compatible callable, swapped out to run against a simulated machine.
+        # Defaults to bleak_retry_connector.establish_connection.
+        self._connector = connector
+        # Refuses connection attempts while the machine is unreachable
+        self.breaker = breaker or CircuitBreaker()
+        self.read_timings: dict = {}
+        # Rolling durations of every connection, read and command phase
+        self.timings = PhaseTimings()
+        # Last raw frames of every characteristic, for diagnostics
+        self.frame_history = {char_uuid: FrameRing() for char_uuid in [*sensor_decoders, CHAR_UUID_CMDRESP]}
+        # Optional framelog.FrameRecorder every frame is also written to
+        self.recorder = None
+        self._last_frames: dict = {}
+        self._state_listeners: list = []
+        self._notifying: set = set()
         self._conn: None | BleakClient = None
+        self._connect_lock = asyncio.Lock()
+        self._session_users = 0
+        self._idle_handle: asyncio.TimerHandle | None = None
+        self._idle_task: asyncio.Task | None = None
+        self._command_lock = asyncio.Lock()
+        self._pending_response: asyncio.Future | None = None
+        self._unsubscribing: asyncio.Task | None = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self._conn is not None and self._conn.is_connected
+
+    @property
+    def in_use(self) -> bool:
+        """Whether a session is currently using the connection."""
+        return self._session_users > 0
 
     async def connect(self, device: BLEDevice) -> bool:
-        # Return early if already connected
-        if self._conn:
-            if self._conn.is_connected:
+        async with self._connect_lock:
+            # Return early if already connected
+            if self.is_connected:
                 return True
-        
+            with self.timings.measure('connect'):
+                try:
+                    connected = await self._connect(device)
+                except Exception:
+                    self._connect_failed()
+                    raise
+            if connected:
+                self.breaker.record_success()
+            else:
+                self._connect_failed()
+            return connected
+
+    def _connect_failed(self) -> None:
+        self.timings.increment('connect_failures')
+        if self.breaker.record_failure():
+            self.timings.increment('breaker_opens')
+            _LOGGER.warning(f'{self.address} unreachable after {self.breaker.failures} attempts, '
+                            f'retrying in {self.breaker.retry_in:.0f}s')
+
+    def check_reachable(self) -> None:
+        """Raises NespressoConnectionError while the circuit breaker refuses connection attempts."""
+        if not self.is_connected and not self.breaker.allow():
+            raise NespressoConnectionError(
+                f'{self.address} is unreachable, next attempt in {self.breaker.retry_in:.0f}s')
+
+    async def _connect(self, device: BLEDevice) -> bool:
         # Establish new connection
-        client = await establish_connection(BleakClient, device, device.address)
+        from bleak import BleakClient
+        connector = self._connector
+        if connector is None:
+            from bleak_retry_connector import establish_connection as connector
+
+        client = None
+
+        async def establish():
+            nonlocal client
+            with self.timings.measure('establish'):
+                client = await connector(BleakClient, device, device.address,
+                                         disconnected_callback=self._on_disconnect)
+            return client
+
+        await establish()
+        try:
+            return await self._handshake(client, device, establish)
+        except BaseException:
+            # Failed or cancelled half way, e.g. a poll preempted by a command or a
+            # command past its deadline: the link would otherwise hold an adapter slot
+            if client is not self._conn:
+                await self._close_link(client)
+            raise
+
+    async def _close_link(self, client: BleakClient) -> None:
+        """Disconnects a link that never became the client's connection."""
+        try:
+            # Completes even if the caller is cancelled again meanwhile
+            await asyncio.shield(client.disconnect())
+        except Exception as e:
+            _LOGGER.debug(f'Could not disconnect {client.address}: {e}')
+
+    async def _handshake(self, client: BleakClient, device: BLEDevice, establish) -> bool:
+        """Pairs, onboards and authenticates a fresh link, or just authenticates a known machine."""
+        if self.bonded and self.isOnboard and self.auth_code:
+            # Bond and onboarding outlive the connection, a known machine only needs the auth key
+            if await self._authenticate(client):
+                return await self._connected(client)
+            _LOGGER.debug(f'Fast reconnect to {device.name} failed, pairing again')
+            self.timings.increment('fast_connect_fallbacks')
+            self.bonded = False
+            if not client.is_connected:
+                client = await establish()
+
         # Pair() has it's own protection against duplicate pairing requests so we just call 
         # it blind in an attempt to negate the constant issues with BT peripherals.
         # The additional sleep step is a further attempt to battle BT gremlins
-        await client.pair()
-        await asyncio.sleep(2)
+        with self.timings.measure('pair'):
+            await client.pair()
+        with self.timings.measure('settle'):
+            await asyncio.sleep(2)
 
         # Try to onboard if not already
         if not self.isOnboard:
-            await self.get_onboard_status(client)
+            if await self.get_onboard_status(client) is None:
+                # Onboarding again with a new key would use up one of the machine's pairing slots
+                await client.disconnect()
+                return False
             if not self.isOnboard:
                 self.auth_code = self.generate_auth_key()
-                await self.onboard(client)
-                await asyncio.sleep(3)
-                await self.get_onboard_status(client)
+                with self.timings.measure('onboard'):
+                    await self.onboard(client)
+                    await asyncio.sleep(3)
+                    await self.get_onboard_status(client)
                 if not self.isOnboard:
                     _LOGGER.error(f'Failed to onboard {device.name}')
+                    await client.disconnect()
                     return False
 
-        if self.auth_code and client.is_connected:
-            _LOGGER.debug(f'Nespresso auth_key: {self.auth_code}')
-            await self.auth(client)
+        if not await self._authenticate(client):
+            _LOGGER.error(f'Failed to connect to Nespresso device: {device.name}')
+            await client.disconnect()
+            return False
+
+        self.bonded = True
+        return await self._connected(client)
 
+    async def _authenticate(self, client: BleakClient) -> bool:
+        """Sends the auth key and checks it was accepted by reading a protected characteristic."""
         try:
+            if self.auth_code and client.is_connected:
+                _LOGGER.debug(f'Nespresso auth_key: {self.auth_code}')
+                with self.timings.measure('auth'):
+                    await self.auth(client)
             # Test reading protected property to verify auth
-            state = await client.read_gatt_char(CHAR_UUID_STATE, response=True)
+            with self.timings.measure('verify'):
+                await client.read_gatt_char(CHAR_UUID_STATE, response=True)
         except Exception as e:
-            _LOGGER.error(f'Failed to connect to Nespresso device: {device.name}')
+            _LOGGER.debug(f'Authentication with {client.address} failed: {e}')
             return False
+        return True
+
+    async def _connected(self, client: BleakClient) -> bool:
+        self._conn = client
 
-        self._conn = client    
+        if self.push_updates:
+            await self.start_state_notifications()
         return True
 
+    def _on_disconnect(self, client: BleakClient) -> None:
+        if client is self._conn:
+            _LOGGER.debug(f'{client.address} disconnected')
+            self._conn = None
+            self._notifying.clear()
+            self._cancel_idle_disconnect()
 
     async def disconnect(self) -> None:
-        await self._conn.disconnect()
-        self._conn = None
+        self._cancel_idle_disconnect()
+        async with self._connect_lock:
+            if self._conn is None:
+                return
+            conn, self._conn = self._conn, None
+            self._notifying.clear()
+            await conn.disconnect()
+
+    @asynccontextmanager
+    async def session(self, device: BLEDevice):
+        """
+        Share one connection between all callers.
+
+        The connection is opened on first use and kept open while any session is
+        active. Once the last session ends it is closed after idle_timeout unless
+        a new session starts in the meantime.
+
+        Raises:
+        NespressoConnectionError: The machine could not be connected or authenticated, or
+        failed to connect too often recently (see CircuitBreaker).
+        """
+        self._cancel_idle_disconnect()
+        self._session_users += 1
+        try:
+            # Home Assistant may not know a connected machine that stopped advertising
+            if device is None and not self.is_connected:
+                raise NespressoConnectionError(f'{self.address} is not reachable')
+            self.check_reachable()
+            if not await self.connect(device):
+                raise NespressoConnectionError(f'Connection failed with {device.name}')
+            yield self
+        finally:
+            self._session_users -= 1
+            if self._session_users == 0:
+                self._schedule_idle_disconnect()
+
+    def _schedule_idle_disconnect(self) -> None:
+        self._cancel_idle_disconnect()
+        # Push mode needs the link up to receive notifications
+        if self.idle_timeout is None or self.push_updates:
+            return
+        self._idle_handle = asyncio.get_running_loop().call_later(
+            self.idle_timeout.total_seconds(), self._idle_disconnect)
+
+    def _cancel_idle_disconnect(self) -> None:
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+
+    def _idle_disconnect(self) -> None:
+        self._idle_handle = None
+        if self._session_users == 0 and self._conn is not None:
+            _LOGGER.debug(f'Closing idle connection to {self.address}')
+            self._idle_task = asyncio.create_task(self.disconnect())
 
     async def scan(self):
         print("Scanning for 5 seconds, please wait...")
 
+        from bleak import BleakScanner
         devices = await BleakScanner.discover(return_adv=True)
 
         for device, advertisment in devices.values():
@@ -133,31 +349,105 @@ class NespressoClient():
 
         return len(self.nespresso_devices)
 
-    async def get_info(self, tries=0):
-        self.devices = {}
+    async def read_characteristics(self, uuids) -> dict:
+        """
+        Reads a batch of characteristics.
+
+        The reads are issued concurrently unless concurrent_reads is disabled for
+        backends that can't queue them. A failed read doesn't affect the others and
+        the time taken by each read is kept in read_timings.
+
+        Parameters:
+        uuids (list): Characteristic UUIDs to read. Duplicates are only read once.
+
+        Returns:
+        dict: Characteristic UUID to the bytes read or the exception raised reading it.
+        """
+        uuids = list(dict.fromkeys(uuids))
+        if self.concurrent_reads:
+            results = await asyncio.gather(*(self._timed_read(char_uuid) for char_uuid in uuids))
+        else:
+            results = [await self._timed_read(char_uuid) for char_uuid in uuids]
+        return dict(zip(uuids, results))
+
+    async def _timed_read(self, char_uuid):
+        start = time.perf_counter()
         try:
-            device = await self.load_model()
-            device.mac_address = self._conn.address
-            for characteristic in device_info_characteristics:
-                try:
-                    data = await self._conn.read_gatt_char(characteristic.uuid)
-                    if characteristic.name == 'device_info':
-                        dmi = decode_machine_information(data)
-                        setattr(device, 'hw_version', dmi['Hardware Version'])
-                        setattr(device, 'fw_version', 
-                                f"{dmi['Main Firmware Version']}, "
-                                f"Bootloader: {dmi['Bootloader Version']}, "
-                                f"Connectivity Firmware: {dmi['Connectivity Firmware Version']}")
-                    else:
-                        setattr(device, characteristic.name, data.decode(characteristic.format))
-                except Exception as e:
-                    print(f'Error reading characteristic {characteristic.name}: {e}')
+            return await self._conn.read_gatt_char(char_uuid)
         except Exception as e:
-            print(f'some other error: {e}')
+            self.timings.increment('read_errors')
+            return e
+        finally:
+            self.read_timings[char_uuid] = elapsed = time.perf_counter() - start
+            self.timings.record('read', elapsed)
+
+    async def get_info(self, tries=0):
+        """
+        Reads the machine's identity.
+
+        Returns:
+        dict: The known devices by address, or None if a read failed. The devices
+        read before are kept as they were then.
+        """
+        frames = await self.read_characteristics(
+            [CHAR_UUID_SERIAL, CHAR_UUID_DEVICE_NAME] + [c.uuid for c in device_info_characteristics])
+        device = self._load_model_from(frames)
+        if device is None:
+            return None
+
+        device.mac_address = self._conn.address
+        for characteristic in device_info_characteristics:
+            data = frames[characteristic.uuid]
+            if isinstance(data, Exception):
+                _LOGGER.warning(f'Error reading characteristic {characteristic.name}: {data}')
+                return None
+            try:
+                if characteristic.name == 'device_info':
+                    self._record_frame(CHAR_UUID_INFO, data)
+                    # Kept raw so a firmware update can be spotted by comparing it
+                    setattr(device, 'machine_information', data.hex())
+                    dmi = decode_machine_information(data)
+                    setattr(device, 'hw_version', dmi['Hardware Version'])
+                    setattr(device, 'fw_version', 
+                            f"{dmi['Main Firmware Version']}, "
+                            f"Bootloader: {dmi['Bootloader Version']}, "
+                            f"Connectivity Firmware: {dmi['Connectivity Firmware Version']}")
+                else:
+                    setattr(device, characteristic.name, data.decode(characteristic.format))
+            except Exception as e:
+                _LOGGER.warning(f'Error reading characteristic {characteristic.name}: {e}')
 
         self.devices[device.mac_address] = device
         return self.devices
     
+    def export_identity(self) -> dict:
+        """
+        Returns the static identity of the machine so it can be cached between restarts.
+
+        Covers what get_info() and get_sensors() read plus the names of the decoded
+        sensor values, which is everything needed to rebuild the device and its entities,
+        and the bond and onboarding state that let the first connection skip pairing.
+        """
+        device = self.devices[self.address]
+        return {
+            'device': device.to_dict(),
+            'sensors': list(self.sensors.get(self.address, [])),
+            'entities': list(self.sensordata.get(self.address, {})),
+            'bonded': self.bonded,
+            'onboarded': bool(self.isOnboard),
+        }
+
+    def restore_identity(self, identity: dict) -> None:
+        """Restores the state export_identity() returned without talking to the machine."""
+        device = CoffeeMachineFactory.from_dict(identity['device'])
+        self.machine = device
+        self.devices = {self.address: device}
+        self.sensors = {self.address: list(identity['sensors'])}
+        # Missing from caches written before the fast reconnect path
+        self.bonded = identity.get('bonded', False)
+        if identity.get('onboarded'):
+            self.isOnboard = True
+
     async def get_sensors(self):
         self.sensors = {}
         sensor_characteristics =  []
@@ -170,39 +460,78 @@ class NespressoClient():
 
     async def get_sensor_data(self):
         now = datetime.now()
-        if self.data_last_updated is None or now - self.data_last_updated > self.data_update_interval:
-            self.data_last_updated = now
-            for mac, characteristics in self.sensors.items():
-                for characteristic in characteristics:
+        self.data_last_updated = now
+        for mac, characteristics in self.sensors.items():
+            frames = await self.read_characteristics(characteristics)
+            decoded = 0
+            for characteristic, data in frames.items():
+                if isinstance(data, Exception):
+                    _LOGGER.warning(f'Error reading {characteristic} from {mac}: {data}')
+                    continue
+                if characteristic in sensor_decoders:
                     try:
-                        data = await self._conn.read_gatt_char(characteristic)
-                        if characteristic in sensor_decoders:
-                            sensor_data = sensor_decoders[characteristic].decode_data(data)
-                            if self.sensordata.get(mac) is None:
-                                self.sensordata[mac] = sensor_data
-                            else:
-                                self.sensordata[mac].update(sensor_data)
+                        self._process_frame(mac, characteristic, data)
                     except Exception as e:
-                        print(f'Error: {e}')
-                        return None
-            end = datetime.now()
-            diff = end - now
-            _LOGGER.debug(f'get_sensor_data() took {diff}')
-            return self.sensordata
+                        _LOGGER.warning(f'Error decoding {characteristic} from {mac}: {e}')
+                        continue
+                    decoded += 1
+            if frames and not decoded:
+                return None
+        end = datetime.now()
+        diff = end - now
+        self.timings.record('poll', diff.total_seconds())
+        _LOGGER.debug(f'get_sensor_data() took {diff}, reads: '
+                      + ', '.join(f'{sensor_decoders[c].name if c in sensor_decoders else c}={t * 1000:.0f}ms'
+                                  for c, t in self.read_timings.items()))
+        return self.sensordata
     
+    def _process_frame(self, mac, characteristic, data):
+        """
+        Decodes a frame into sensordata unless it's identical to the last frame of
+        that characteristic, in which case the previous decode is still valid.
+
+        Returns:
+        dict: The decoded values, or None if the frame didn't change.
+        """
+        self._record_frame(characteristic, data)
+        last_frames = self._last_frames.setdefault(mac, {})
+        if last_frames.get(characteristic) == data:
+            return None
+        sensor_data = sensor_decoders[characteristic].decode_data(data)
+        last_frames[characteristic] = bytes(data)
+        self.sensordata.setdefault(mac, {}).update(sensor_data)
+        return sensor_data
+
+    def _record_frame(self, characteristic, data):
+        timestamp = time.time()
+        self.frame_history[characteristic].append(data, timestamp)
+        if self.recorder is not None:
+            self.recorder.record(characteristic, data, timestamp)
+
+    def _invalidate_frame(self, characteristic):
+        """Forget the last frame of a characteristic a command just changed."""
+        self._last_frames.get(self.address, {}).pop(characteristic, None)
+
     async def get_onboard_status(self, client: BleakClient):
         try:
             onboard = await client.read_gatt_char(CHAR_UUID_ONBOARD_STATUS) != bytearray(b'\x00')
         except Exception as e:
-            _LOGGER.error('Couldn\'t read onboarding status of device. Probably BT Dongle incompatible?')
+            _LOGGER.error(f'Couldn\'t read onboarding status of device. Probably BT Dongle incompatible? {e}')
+            return None
         self.isOnboard = onboard
         return self.isOnboard
 
     async def load_model(self):
+        frames = await self.read_characteristics([CHAR_UUID_SERIAL, CHAR_UUID_DEVICE_NAME])
+        return self._load_model_from(frames)
+
+    def _load_model_from(self, frames: dict):
         try:
-            serial = await self._conn.read_gatt_char(CHAR_UUID_SERIAL)
+            serial, device_name = frames[CHAR_UUID_SERIAL], frames[CHAR_UUID_DEVICE_NAME]
+            for data in (serial, device_name):
+                if isinstance(data, Exception):
+                    raise data
             serial = serial.decode('utf-8')
-            device_name = await self._conn.read_gatt_char(CHAR_UUID_DEVICE_NAME)
             device_name = device_name.decode('utf-8')
 
             self.machine = CoffeeMachineFactory.get_coffee_machine(device_name, serial)
@@ -221,14 +550,54 @@ class NespressoClient():
             # Write the auth code
             await client.write_gatt_char(CHAR_UUID_AUTH, binascii.unhexlify(self.auth_code), response=True)
         except Exception as e:
-            if e.dbus_error == 'org.bluez.Error.NotPermitted':
+            if getattr(e, 'dbus_error', None) == 'org.bluez.Error.NotPermitted':
                 _LOGGER.error('Onboarding not permitted. Already paired?')
 
     def notification_handler(self, sender, data):
+        self._record_frame(CHAR_UUID_CMDRESP, data)
         self.command_response = commandResponse.from_byte_buffer(data).value
+        if self._pending_response is not None and not self._pending_response.done():
+            self._pending_response.set_result(self.command_response)
 
     def state_notification_handler(self, sender, data):
         self.state_response = data
+        if sender.uuid not in sensor_decoders:
+            return
+
+        mac = self._conn.address if self._conn else self.address
+        sensor_data = self._process_frame(mac, sender.uuid, data)
+        if sensor_data is None:
+            return
+        for listener in self._state_listeners:
+            listener(mac, sensor_data)
+
+    def add_state_listener(self, listener):
+        """
+        Register a callback for decoded state notifications.
+
+        Parameters:
+        listener (callable): Called with (mac, decoded_data) for every notification.
+
+        Returns:
+        Callable that removes the listener again.
+        """
+        self._state_listeners.append(listener)
+        return lambda: self._state_listeners.remove(listener)
+
+    async def start_state_notifications(self):
+        """Subscribe to every sensor characteristic of the machine that supports notify or indicate."""
+        for char_uuid in notify_characteristics:
+            if char_uuid in self._notifying:
+                continue
+            characteristic = self._conn.services.get_characteristic(char_uuid)
+            if characteristic is None or not {'notify', 'indicate'} & set(characteristic.properties):
+                continue
+            try:
+                await self._conn.start_notify(characteristic, self.state_notification_handler)
+                self._notifying.add(char_uuid)
+            except Exception as e:
+                _LOGGER.warning(f'Could not subscribe to {char_uuid} on {self.address}: {e}')
+        return self._notifying
 
     def generate_auth_key(self):
         unique_id = uuid.uuid4()
@@ -237,7 +606,8 @@ class NespressoClient():
 
     async def brew_predefined(self, 
                               brew: BrewType = BrewType.RISTRETTO, 
-                              temp: Temprature = Temprature.MEDIUM):
+                              temp: Temprature = Temprature.MEDIUM,
+                              deadline: float | None = None):
         if not BrewType.is_brew_applicable_for_machine(brew, self.devices[self._conn.address].model):
             _LOGGER.error(f'{brew.name} is not valid for {self.devices[self._conn.address].model.name}')
             return
@@ -251,7 +621,7 @@ class NespressoClient():
             buffer[8] = temp.value if self.devices[self._conn.address].configurations['temprature_control'] else Temprature.MEDIUM.value
             buffer[9] = brew.value
 
-            brew_response = await self._send_command(CHAR_UUID_BREW, buffer, response=True)
+            brew_response = await self._send_command(CHAR_UUID_BREW, buffer, response=True, deadline=deadline)
 
             return brew_response
         except Exception as e:
@@ -260,7 +630,8 @@ class NespressoClient():
     async def brew_custom(self, 
                           coffee_ml: int = 100, 
                           water_ml: int = 100, 
-                          temp: Temprature = Temprature.MEDIUM):
+                          temp: Temprature = Temprature.MEDIUM,
+                          deadline: float | None = None):
         if not self.machine.configurations['custom_recipes']:
             _LOGGER.error(f'Custom Recepies are not supported for {self.machine}')
             return False
@@ -276,9 +647,13 @@ class NespressoClient():
         buffer[8] = Ingredient.WATER.value
         buffer[9:11] = water_ml.to_bytes(2)
 
+        # Both steps share one budget
+        if deadline is None:
+            deadline = asyncio.get_running_loop().time() + COMMAND_TIMEOUT
         prep_response = await self._send_command(CHAR_UUID_BREW, 
                                 buffer, 
-                                response=True)
+                                response=True,
+                                deadline=deadline)
         if prep_response != 'Done':
             _LOGGER.error(f'Preparing custom brew command failed: {prep_response}')
             return prep_response
@@ -294,11 +669,12 @@ class NespressoClient():
 
         brew_response = await self._send_command(CHAR_UUID_BREW, 
                                 buffer, 
-                                response=True)
+                                response=True,
+                                deadline=deadline)
 
         return brew_response
     
-    async def update_caps_counter(self, caps: int):
+    async def update_caps_counter(self, caps: int, deadline: float | None = None):
         if not caps > 0 and not caps < 1000:
             _LOGGER.error(f'Value of caps must be between 1 and 1000')
             return
@@ -309,11 +685,13 @@ class NespressoClient():
         response = await self._send_command(
             CHAR_UUID_NBCAPS, 
             buffer, 
-            response=False)
+            response=False,
+            deadline=deadline)
+        self._invalidate_frame(CHAR_UUID_NBCAPS)
 
         return response
     
-    async def update_water_hardness(self, level: int):
+    async def update_water_hardness(self, level: int, deadline: float | None = None):
         if not level >= 0 and not level < 4:
             _LOGGER.error(f'Value of water hardness must be between 0 and 4')
             return
@@ -326,14 +704,43 @@ class NespressoClient():
         response = await self._send_command(
             CHAR_UUID_WATER_HARDNESS, 
             buffer, 
-            response=False)
+            response=False,
+            deadline=deadline)
+        self._invalidate_frame(CHAR_UUID_WATER_HARDNESS)
 
         return response
     
+    async def _ensure_command_notifications(self):
+        """Subscribe to CMDRESP once per connection; responses are routed to the waiting command."""
+        if self._unsubscribing is not None:
+            await self._unsubscribing
+            self._unsubscribing = None
+        if CHAR_UUID_CMDRESP in self._notifying:
+            return
+        await self._conn.start_notify(CHAR_UUID_CMDRESP, self.notification_handler)
+        self._notifying.add(CHAR_UUID_CMDRESP)
+
+    def _abandon_command_notifications(self):
+        """
+        Unsubscribe from CMDRESP after a command was given up on, so a late response to
+        it can't be taken for the response of the next command. Runs in the background
+        so the deadline of the abandoned command holds; the next command waits for it.
+        """
+        self._notifying.discard(CHAR_UUID_CMDRESP)
+        if self.is_connected:
+            self._unsubscribing = asyncio.get_running_loop().create_task(self._stop_command_notifications(self._conn))
+
+    async def _stop_command_notifications(self, conn):
+        try:
+            await conn.stop_notify(CHAR_UUID_CMDRESP)
+        except Exception as e:
+            _LOGGER.debug(f'Could not unsubscribe from command responses of {self.address}: {e}')
+
     async def _send_command(self,  
                             characteristic: uuid,
                             command: bytes, 
-                            response: bool = False) -> str | bool:
+                            response: bool = False,
+                            deadline: float | None = None) -> str | bool:
         """
         Attempts to send given command and return the response string or False
         if no response is expected.
@@ -341,56 +748,80 @@ class NespressoClient():
         Parameters:
         characteristic (uuid): Characteristic UUID to write command to
         command (bytes): Bytes to send as a list.
-        response (bool): Default: False. Setup CMDRESP notification handler and await response.
+        response (bool): Default: False. Await the response on the CMDRESP notification.
+        deadline (float): Event loop time (loop.time()) by which the command has to be done,
+        COMMAND_TIMEOUT from now by default. Waiting for earlier commands counts against it.
 
         Returns:
         Response string or True if response is expected. False if no response was received.
+
+        Commands are serialised so concurrent callers each receive their own response.
+        Retries share what is left of the deadline. A command that is cancelled or runs
+        out of time leaves no response pending and no stale subscription behind.
         """
+        if deadline is None:
+            deadline = asyncio.get_running_loop().time() + COMMAND_TIMEOUT
         try:
-            if response:
-                self.command_response = None
-
-                await self._conn.start_notify(CHAR_UUID_CMDRESP, 
-                                            self.notification_handler)
-
-                for i in range(3):
-                    _LOGGER.debug(f'Attempt {i} to send {command} to {self.machine.name}')
-                    await self._conn.write_gatt_char(characteristic, 
-                                                    command, 
-                                                    response=True)
-                    for _ in range(5):
-                        if self.command_response is not None:
-                            break
-                        await asyncio.sleep(1) 
-                        
-                    if self.command_response is not None:
-                        break  # Exit outer loop if a response was received
-
-                    # Delay between attempts
-                    await asyncio.sleep(1)
-                
-                if self.command_response is None:
-                    _LOGGER.error(f'No response received from {self.machine.name} after 3 attempts')
-                    await self._conn.stop_notify(CHAR_UUID_CMDRESP)
-                    return False
-
-                await self._conn.stop_notify(CHAR_UUID_CMDRESP)
-            else:
-                await self._conn.write_gatt_char(characteristic, 
-                                                command)
-                return True
+            async with asyncio.timeout_at(deadline):
+                async with self._command_lock:
+                    if not response:
+                        with self.timings.measure('write'):
+                            await self._conn.write_gatt_char(characteristic, 
+                                                            command)
+                        return True
+                    command_response = await self._exchange(characteristic, command, deadline)
+        except TimeoutError:
+            self.timings.increment('command_deadlines')
+            _LOGGER.error(f'Command to {self.machine.name} did not complete before its deadline')
+            return False
         except Exception as e:
             _LOGGER.error(f'Failed to send command to {self.machine.name}: {e}')
-            if response:
-                await self._conn.stop_notify(CHAR_UUID_CMDRESP)
             return False
 
-        _LOGGER.debug(f'Received command respose: {self.command_response} from {self.machine.name}')
-        return self.command_response
+        if command_response is None:
+            _LOGGER.error(f'No response received from {self.machine.name} after {COMMAND_ATTEMPTS} attempts')
+            return False
+        _LOGGER.debug(f'Received command respose: {command_response} from {self.machine.name}')
+        return command_response
 
+    async def _exchange(self, characteristic, command: bytes, deadline: float) -> str | None:
+        """Writes a command until the machine responds on CMDRESP, within COMMAND_ATTEMPTS and the deadline."""
+        loop = asyncio.get_running_loop()
+        command_response = None
+        try:
+            await self._ensure_command_notifications()
+            self.command_response = None
+
+            for i in range(COMMAND_ATTEMPTS):
+                _LOGGER.debug(f'Attempt {i} to send {command} to {self.machine.name}')
+                if i:
+                    self.timings.increment('command_retries')
+                # Created before the write so an immediate notification can't be missed
+                self._pending_response = loop.create_future()
+                start = time.perf_counter()
+                await self._conn.write_gatt_char(characteristic, 
+                                                command, 
+                                                response=True)
+                # Attempts left share the remaining budget, so a retry always fits in
+                wait = min(COMMAND_RESPONSE_TIMEOUT, (deadline - loop.time()) / (COMMAND_ATTEMPTS - i))
+                try:
+                    command_response = await asyncio.wait_for(self._pending_response, max(wait, 0))
+                    self.timings.record('command', time.perf_counter() - start)
+                    break
+                except asyncio.TimeoutError:
+                    self.timings.increment('command_timeouts')
+                    continue
+        finally:
+            self._pending_response = None
+            if command_response is None:
+                self._abandon_command_notifications()
+        return command_response
 
 
 async def main():
+    import pprint
+    from bleak import BleakClient
+
     # Test Machine
     nespresso_client = NespressoClient(180, 'e37d7534af63435d', 'DF:81:37:AD:93:83')
     
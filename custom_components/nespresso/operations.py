@@ -0,0 +1,180 @@
+"""
+Per machine queue that runs one operation at a time, most urgent first.
+
+User commands are queued ahead of background reads and preempt a poll that is
+already running: the poll is cancelled, the command runs, and the poll is
+queued again. An operation can only be preempted once it called
+mark_preemptible(), a poll does that when its connection is up. Cancelling it
+while it connects would throw the half made link away and the command would
+have to connect again from scratch. Operations submitted with the same key
+while one is still waiting collapse into it, so polls can't pile up behind a
+slow command.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+PRIORITY_COMMAND = 0
+PRIORITY_POLL = 10
+
+
+class _Operation:
+    __slots__ = ('priority', 'sequence', 'func', 'key', 'preemptible', 'future', 'task', 'preempted')
+
+    def __init__(self, priority, sequence, func, key, future) -> None:
+        self.priority = priority
+        self.sequence = sequence
+        self.func = func
+        self.key = key
+        self.preemptible = False
+        self.future = future
+        self.task = None
+        self.preempted = False
+
+    def __lt__(self, other) -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class OperationQueue:
+    def __init__(self, name: str = '') -> None:
+        self.name = name
+        self._heap: list = []
+        self._sequence = itertools.count()
+        self._waiting: dict = {}
+        self._current: _Operation | None = None
+        self._worker: asyncio.Task | None = None
+
+    async def submit(self, func, priority: int = PRIORITY_COMMAND, key=None):
+        """
+        Queues an operation and waits for its result.
+
+        Parameters:
+        func (callable): Coroutine function run without arguments once it's this operation's turn.
+        priority (int): Lower runs first. See PRIORITY_COMMAND and PRIORITY_POLL.
+        key (hashable): Operations with the same key that are still waiting share one run.
+
+        Returns:
+        Whatever func returned. Exceptions raised by func are raised here.
+        """
+        if key is not None and key in self._waiting:
+            operation = self._waiting[key]
+        else:
+            operation = _Operation(priority, next(self._sequence), func, key,
+                                   asyncio.get_running_loop().create_future())
+            self._push(operation)
+            self._preempt_for(operation)
+            if self._worker is None or self._worker.done():
+                self._worker = asyncio.create_task(self._run())
+
+        try:
+            return await asyncio.shield(operation.future)
+        except asyncio.CancelledError:
+            # A collapsed operation may still have other callers waiting for it
+            if operation.key is None:
+                self._cancel(operation)
+            raise
+
+    def mark_preemptible(self) -> None:
+        """
+        Lets the calling operation be cancelled and requeued when a more urgent one
+        is submitted, from now until it ends. One that is already waiting preempts
+        it right away, the cancellation is raised at its next await.
+        """
+        current = self._current
+        if current is None or current.task is not asyncio.current_task() or current.preemptible:
+            return
+        current.preemptible = True
+        urgent = [operation for operation in self._heap if not operation.future.done()]
+        if urgent:
+            self._preempt_for(min(urgent))
+
+    async def shutdown(self) -> None:
+        """Cancels the running and all waiting operations."""
+        for operation in self._heap:
+            operation.future.cancel()
+        self._heap.clear()
+        self._waiting.clear()
+        tasks = []
+        current = self._current
+        if current is not None:
+            # The worker exits without resolving it, its callers would wait forever
+            current.future.cancel()
+            current.task.cancel()
+            tasks.append(current.task)
+        if self._worker is not None:
+            self._worker.cancel()
+            tasks.append(self._worker)
+            self._worker = None
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _push(self, operation: _Operation) -> None:
+        heapq.heappush(self._heap, operation)
+        if operation.key is not None:
+            self._waiting[operation.key] = operation
+
+    def _preempt_for(self, operation: _Operation) -> None:
+        current = self._current
+        if (current is not None and current.preemptible and not current.preempted
+                and operation.priority < current.priority and not current.task.done()):
+            _LOGGER.debug(f'{self.name}: preempting running operation for a more urgent one')
+            current.preempted = True
+            current.task.cancel()
+
+    def _cancel(self, operation: _Operation) -> None:
+        if operation is self._current:
+            operation.task.cancel()
+        elif not operation.future.done():
+            # Left in the heap, the worker skips operations that are already done
+            operation.future.cancel()
+            if operation.key is not None and self._waiting.get(operation.key) is operation:
+                del self._waiting[operation.key]
+
+    def _requeue(self, operation: _Operation) -> None:
+        waiting = self._waiting.get(operation.key) if operation.key is not None else None
+        if waiting is None:
+            # Preemptible again once its next run got as far
+            operation.preempted = False
+            operation.preemptible = False
+            self._push(operation)
+            return
+        # An equivalent operation was queued meanwhile, the preempted one resolves with it
+        waiting.future.add_done_callback(lambda future: _copy_result(future, operation.future))
+
+    async def _run(self) -> None:
+        try:
+            while self._heap:
+                operation = heapq.heappop(self._heap)
+                if operation.future.done():
+                    continue
+                if operation.key is not None and self._waiting.get(operation.key) is operation:
+                    del self._waiting[operation.key]
+
+                self._current = operation
+                operation.task = asyncio.create_task(operation.func())
+                try:
+                    await asyncio.wait((operation.task,))
+                finally:
+                    self._current = None
+                    if not operation.task.done():
+                        operation.task.cancel()
+
+                if operation.preempted:
+                    self._requeue(operation)
+                else:
+                    _copy_result(operation.task, operation.future)
+        finally:
+            self._worker = None
+
+
+def _copy_result(source: asyncio.Future, target: asyncio.Future) -> None:
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
@@ -0,0 +1,137 @@
+"""
+Replays recorded frames through the same decode path as a live machine.
+
+Frames (e.g. from framelog.FrameLog.scan()) are fed to NespressoClient's frame
+processing exactly as if they had just been read or notified. Every frame that
+changes the decoded snapshot is passed on like the coordinator pushes data to
+its entities. Replays run as fast as possible or at the recorded pace, and
+report the resulting state timeline and the time spent decoding and updating.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+
+try:
+    from . import commandResponse
+    from .nespresso import CHAR_UUID_CMDRESP, NespressoClient, sensor_decoders
+except ImportError:
+    import commandResponse
+    from nespresso import CHAR_UUID_CMDRESP, NespressoClient, sensor_decoders
+
+REPLAY_ADDRESS = '00:00:00:00:00:00'
+
+
+@dataclass
+class Transition:
+    timestamp: float
+    name: str
+    old: object
+    new: object
+
+
+@dataclass
+class ReplayReport:
+    frames: int = 0
+    decoded: int = 0
+    unchanged: int = 0
+    errors: int = 0
+    updates: int = 0
+    decode_time: float = 0.0
+    update_time: float = 0.0
+    wall_time: float = 0.0
+    first_timestamp: float | None = None
+    last_timestamp: float | None = None
+    timeline: list = field(default_factory=list)
+    command_responses: list = field(default_factory=list)
+
+    @property
+    def decode_throughput(self) -> float:
+        """Frames processed per second of decode time."""
+        return self.frames / self.decode_time if self.decode_time else 0.0
+
+    @property
+    def end_to_end_throughput(self) -> float:
+        """Frames per second including the updates, the cost of a replay at full speed."""
+        busy = self.decode_time + self.update_time
+        return self.frames / busy if busy else 0.0
+
+
+class FrameReplay:
+    def __init__(self, frames, client: NespressoClient | None = None, realtime: bool = False,
+                 speed: float = 1.0, keep_timeline: bool = True) -> None:
+        """
+        Parameters:
+        frames (iterable): (timestamp, characteristic UUID, bytes) in recorded order.
+        client (NespressoClient): Client whose decode state is used, a fresh one by default.
+        realtime (bool): Wait between frames as long as they were apart when recorded.
+        speed (float): Speed up factor of a realtime replay.
+        keep_timeline (bool): Record every value transition in the report.
+        """
+        self.frames = frames
+        self.client = client or NespressoClient(mac=REPLAY_ADDRESS)
+        self.realtime = realtime
+        self.speed = speed
+        self.keep_timeline = keep_timeline
+
+    async def run(self, on_update=None) -> ReplayReport:
+        """
+        Replays all frames.
+
+        Parameters:
+        on_update (callable): Called with (timestamp, snapshot) whenever a frame changed
+        the decoded snapshot, where the coordinator would update its entities.
+
+        Returns:
+        ReplayReport: Counts, timings and the state timeline of the replay.
+        """
+        report = ReplayReport()
+        client = self.client
+        mac = client.address
+        snapshot: dict = {}
+        started = time.perf_counter()
+        previous = None
+
+        for timestamp, char_uuid, frame in self.frames:
+            if self.realtime and previous is not None and timestamp > previous:
+                await asyncio.sleep((timestamp - previous) / self.speed)
+            previous = timestamp
+            if report.first_timestamp is None:
+                report.first_timestamp = timestamp
+            report.last_timestamp = timestamp
+            report.frames += 1
+
+            start = time.perf_counter()
+            try:
+                if char_uuid == CHAR_UUID_CMDRESP:
+                    report.command_responses.append((timestamp, commandResponse.from_byte_buffer(frame).value))
+                    decoded = None
+                elif char_uuid in sensor_decoders:
+                    decoded = client._process_frame(mac, char_uuid, frame)
+                else:
+                    decoded = None
+            except Exception:
+                report.errors += 1
+                continue
+            finally:
+                report.decode_time += time.perf_counter() - start
+
+            if decoded is None:
+                report.unchanged += char_uuid in sensor_decoders
+                continue
+            report.decoded += 1
+
+            changed = {name: value for name, value in decoded.items() if snapshot.get(name) != value}
+            if not changed:
+                continue
+            if self.keep_timeline:
+                report.timeline.extend(Transition(timestamp, name, snapshot.get(name), value)
+                                       for name, value in changed.items())
+            snapshot = {**snapshot, **changed}
+            report.updates += 1
+            if on_update is not None:
+                start = time.perf_counter()
+                on_update(timestamp, snapshot)
+                report.update_time += time.perf_counter() - start
+
+        report.wall_time = time.perf_counter() - started
+        return report
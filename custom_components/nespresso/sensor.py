@@ -6,47 +6,31 @@ For more details about this platform, please refer to the documentation at
 https://home-assistant.io/components/sensor.Nespresso/
 """
 import logging
-from datetime import timedelta, datetime
 
-import voluptuous as vol
-
-import homeassistant.helpers.config_validation as cv
 from homeassistant.core import HomeAssistant, callback
-from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.components.sensor import PLATFORM_SCHEMA
+from homeassistant.const import (CONF_ADDRESS, STATE_UNAVAILABLE, STATE_UNKNOWN,
+                                 CONF_TOKEN, EntityCategory)
+from homeassistant.components.sensor import SensorDeviceClass
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers import device_registry as dr
-from homeassistant.const import (ATTR_DEVICE_CLASS, ATTR_ICON, CONF_ADDRESS,
-                                 CONF_NAME, CONF_RESOURCE, CONF_SCAN_INTERVAL,
-                                 CONF_UNIT_SYSTEM,
-                                 EVENT_HOMEASSISTANT_STOP, STATE_UNKNOWN,
-                                 CONF_TOKEN)
-from homeassistant.components.binary_sensor import (PLATFORM_SCHEMA, BinarySensorEntity,
-                                                   BinarySensorDeviceClass)
-from homeassistant.helpers.entity import Entity, DeviceInfo
-from homeassistant.components.bluetooth import async_ble_device_from_address
-
-from .nespresso import NespressoClient
+from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.helpers.restore_state import RestoreEntity
+from homeassistant.helpers.update_coordinator import CoordinatorEntity, UpdateFailed
+
+from .coordinator import NespressoDataUpdateCoordinator
+from .nespresso import NespressoConnectionError
 from .machines import Temprature, BrewType
-from bleak import BleakClient
-from bleak_retry_connector import establish_connection
 
 _LOGGER = logging.getLogger(__name__)
 
-SCAN_INTERVAL = timedelta(seconds=60)
-
 DEVICE_CLASS_CAPS='caps'
+DEVICE_CLASS_DOOR='door'
 CAPS_UNITS = 'caps'
 
 from .const import DOMAIN
 
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
-    vol.Required(CONF_ADDRESS, default=''): cv.string,
-    vol.Required(CONF_TOKEN): cv.string,
-    vol.Optional(CONF_SCAN_INTERVAL, default=SCAN_INTERVAL): cv.time_period,
-})
-
 
 class Sensor:
     def __init__(self, unit, unit_scale, device_class, icon):
@@ -78,130 +62,248 @@ DEVICE_SENSOR_SPECIFICS = { "state":Sensor(None, None, None, None),
                             "Fault":Sensor(None, None, None, 'mdi:alert-circle-outline'),
                             "descaling_counter":Sensor(None, None, None, 'mdi:silverware-clean'),
                             "water_hardness":Sensor(None, None, None, 'mdi:water-percent'),
-                            "slider":Sensor(None, None, BinarySensorDeviceClass.DOOR, 'mdi:gate-and'),
+                            "slider":Sensor(None, None, DEVICE_CLASS_DOOR, 'mdi:gate-and'),
                             "caps_number": Sensor(CAPS_UNITS, None, DEVICE_CLASS_CAPS, 'mdi:counter'),
                             "water_fresh": Sensor(None, None, None, None)
                            }
 
+SIGNAL_STRENGTH_SPECIFICS = Sensor('dBm', None, SensorDeviceClass.SIGNAL_STRENGTH, 'mdi:bluetooth')
+
+# Diagnostic sensors over NespressoClient.timings: sensor name -> (phase or counter, percentile)
+TIMING_SENSORS = { "connect_time_p50": ('connect', 50),
+                   "connect_time_p95": ('connect', 95),
+                   "read_time_p50": ('read', 50),
+                   "read_time_p95": ('read', 95),
+                   "command_time_p50": ('command', 50),
+                   "command_time_p95": ('command', 95),
+                   "command_retries": ('command_retries', None),
+                   "connect_failures": ('connect_failures', None),
+                 }
+TIMING_SPECIFICS = Sensor('ms', 1000, SensorDeviceClass.DURATION, 'mdi:timer-outline')
+COUNTER_SPECIFICS = Sensor(None, None, None, 'mdi:counter')
+
 
 async def async_setup_entry(hass: HomeAssistant, config: ConfigEntry, async_add_entities: AddEntitiesCallback, discovery_info=None) -> None:
     """Set up the Nespresso sensor."""
-    scan_interval = SCAN_INTERVAL
+    coordinator = hass.data[DOMAIN][config.entry_id]
     mac = config.data.get(CONF_ADDRESS)
     auth = config.data.get(CONF_TOKEN)
 
-    _LOGGER.debug("Create the top level device..")
-    device_registry = dr.async_get(hass)
-
-    _LOGGER.debug("Searching for Nespresso sensors...")
-    try:
-        Nespressodetect = NespressoClient(scan_interval, auth, mac)
-        ble_device = async_ble_device_from_address(hass, mac)
-        await Nespressodetect.connect(ble_device)
-    except UnboundLocalError:
-        raise ConfigEntryNotReady()
-    try:
-        _LOGGER.debug("Getting info about device(s)")
-        devices_info = await Nespressodetect.get_info()
-        for mac, dev in devices_info.items():
-            _LOGGER.info("{}: {}".format(mac, dev))
-
-        NespressoDeviceEntry = device_registry.async_get_or_create(
-            config_entry_id=config.entry_id,
-            connections={(dr.CONNECTION_NETWORK_MAC, mac)},
-            identifiers={(DOMAIN, mac)},
-            manufacturer="Nespresso",
-            suggested_area="Kitchen",
-            name=dev.name,
-            model=dev.model.name,
-            sw_version=dev.fw_version,
-            hw_version=dev.hw_version,
-            serial_number=dev.serial,
-        )
-
+    Nespressodetect = coordinator.client
 
-        _LOGGER.debug("Getting sensors")
-        devices_sensors = await Nespressodetect.get_sensors()
-        for mac, sensors in devices_sensors.items():
-            for sensor in sensors:
-                _LOGGER.debug("{}: Found sensor UUID: {}".format(mac, sensor))
+    @callback
+    def _async_add_nespresso_entities() -> None:
+        _LOGGER.debug("Create the top level device..")
+        NespressoDeviceEntry = coordinator.async_update_device_registry()
+        devices_info = Nespressodetect.devices
 
-        _LOGGER.debug("Get initial sensor data to populate HA entities")
         ha_entities = []
-        sensordata = await Nespressodetect.get_sensor_data()
-        for mac, data in sensordata.items():
-            for name, val in data.items():
-                _LOGGER.debug("{}: {}: {}".format(mac, name, val))
-                ha_entities.append(NespressoSensor(mac, auth, name, Nespressodetect, devices_info[mac].manufacturer,
-                                                   DEVICE_SENSOR_SPECIFICS[name], NespressoDeviceEntry))
-        
-        await Nespressodetect.disconnect()
-    except:
-        _LOGGER.exception("Failed intial setup.")
-        return
-
-    async_add_entities(ha_entities, True)
-    
+        for name in coordinator.device_cache['entities']:
+            ha_entities.append(NespressoSensor(coordinator, mac, auth, name, devices_info[mac].manufacturer,
+                                               DEVICE_SENSOR_SPECIFICS[name], NespressoDeviceEntry))
+        ha_entities.append(NespressoSignalSensor(coordinator, mac, auth, 'rssi', devices_info[mac].manufacturer,
+                                                 SIGNAL_STRENGTH_SPECIFICS, NespressoDeviceEntry))
+        for name, (phase, percentile) in TIMING_SENSORS.items():
+            ha_entities.append(NespressoTimingSensor(coordinator, mac, auth, name, devices_info[mac].manufacturer,
+                                                     COUNTER_SPECIFICS if percentile is None else TIMING_SPECIFICS,
+                                                     NespressoDeviceEntry, phase, percentile))
+        async_add_entities(ha_entities)
+
+    # Setup never waits for the machine: entities come from the cached device info
+    # with their last known state and the first poll runs in the background
+    if coordinator.device_cache is not None:
+        _LOGGER.debug("Using cached device info for %s", mac)
+        _async_add_nespresso_entities()
+    else:
+        _LOGGER.debug("Searching for Nespresso sensors...")
+        remove_listener = None
+
+        @callback
+        def _async_identified() -> None:
+            nonlocal remove_listener
+            if coordinator.device_cache is None or remove_listener is None:
+                return
+            remove_listener()
+            remove_listener = None
+            _async_add_nespresso_entities()
+
+        # Also keeps the coordinator polling until the machine has been identified
+        remove_listener = coordinator.async_add_listener(_async_identified)
+
+        @callback
+        def _async_remove_listener() -> None:
+            if remove_listener is not None:
+                remove_listener()
+
+        config.async_on_unload(_async_remove_listener)
+
+    config.async_create_background_task(hass, coordinator.async_refresh(), f"{DOMAIN} {mac} first refresh")
+
+    # Registered by the first machine, calls are routed to their target's coordinator
+    if not hass.services.has_service(DOMAIN, "coffee"):
+        _async_register_services(hass)
+
+
+@callback
+def _coordinator_for(hass: HomeAssistant, call) -> NespressoDataUpdateCoordinator:
+    """The coordinator of the machine a service call targets by device_id or address.
+
+    Either can be left out while only one machine is configured.
+    """
+    coordinators = [coordinator for coordinator in hass.data.get(DOMAIN, {}).values()
+                    if isinstance(coordinator, NespressoDataUpdateCoordinator)]
+    device_id = call.data.get('device_id')
+    address = call.data.get(CONF_ADDRESS)
+    if device_id:
+        device = dr.async_get(hass).async_get(device_id)
+        entry_ids = device.config_entries if device else set()
+        matches = [coordinator for coordinator in coordinators if coordinator.entry.entry_id in entry_ids]
+    elif address:
+        matches = [coordinator for coordinator in coordinators if coordinator.mac.upper() == address.upper()]
+    else:
+        matches = coordinators
+    if not matches:
+        raise HomeAssistantError(f"No configured Nespresso machine matches {device_id or address or call.service}")
+    if len(matches) > 1:
+        raise HomeAssistantError(f"{call.service} needs the device_id or address of the machine to use")
+    return matches[0]
+
+
+SERVICES = ("coffee", "caps", "water_hardness", "refresh_device_info")
+
+
+@callback
+def _async_register_services(hass: HomeAssistant) -> None:
+    """Register the services once, shared by every configured machine."""
+
+    def _deadline(call):
+        """Event loop time by which the call has to be done, from its optional timeout in seconds."""
+        timeout = call.data.get('timeout')
+        return hass.loop.time() + timeout if timeout else None
+
     async def brew(call):
         """Send a command command."""
+        coordinator = _coordinator_for(hass, call)
+        deadline = _deadline(call)
+        coffee_ml = call.data.get('coffee_ml')
+        water_ml = call.data.get('water_ml')
         try:
             brewType = BrewType[call.data.get('brew_type').upper()] if call.data.get('brew_type') else None
             temprature = Temprature[call.data.get('brew_temp').upper()] if call.data.get('brew_temp') else Temprature.MEDIUM
-            coffee_ml = call.data.get('coffee_ml')
-            water_ml = call.data.get('water_ml')
-        except KeyError:
-            brewType = None
-            _LOGGER.debug(f"Brew Failed - Recepie: {brewType}, Temp: {temprature} ")
-        
+        except KeyError as e:
+            _LOGGER.error(f"Brew Failed - unknown recipe or temperature {e}")
+            return None
+
         try:
-            ble_device = async_ble_device_from_address(hass, mac)
-            conn_status = await Nespressodetect.connect(ble_device)
-            if conn_status:
-                if coffee_ml and water_ml:
-                    response =  await Nespressodetect.brew_custom(coffee_ml=coffee_ml, water_ml=water_ml, temp=temprature)
-                else:
-                    response =  await Nespressodetect.brew_predefined(brew=brewType, temp=temprature)
-                await Nespressodetect.disconnect()
-                return response
-            _LOGGER.error(f"Connection failed with {ble_device.name}")
+            if coffee_ml and water_ml:
+                response = await coordinator.async_command(
+                    lambda client: client.brew_custom(coffee_ml=coffee_ml, water_ml=water_ml, temp=temprature,
+                                                      deadline=deadline), deadline)
+            else:
+                response = await coordinator.async_command(
+                    lambda client: client.brew_predefined(brew=brewType, temp=temprature, deadline=deadline), deadline)
+            return response
+        except NespressoConnectionError as e:
+            _LOGGER.error(e)
             return None
-        except:
-            _LOGGER.debug(f"Brew Failed - Recepie: {brewType}, Temp: {temprature} ")
+        except TimeoutError:
+            _LOGGER.error(f"Brew did not complete within {call.data.get('timeout')}s")
+            return None
+        except Exception as e:
+            _LOGGER.exception("Brew failed - recipe: %s, temperature: %s: %s", brewType, temprature, e)
 
         return None
 
     async def caps(call):
         """Update the caps counter"""
+        coordinator = _coordinator_for(hass, call)
         caps = call.data.get('caps')
+        deadline = _deadline(call)
 
         try: 
-            ble_device = async_ble_device_from_address(hass, mac)
-            conn_status = await Nespressodetect.connect(ble_device)
-            if conn_status:
-                if caps:
-                    caps = int(round(caps))
-                    await Nespressodetect.update_caps_counter(caps)
-                    await Nespressodetect.disconnect()
-                    Nespressodetect.sensordata[mac]['caps_number'] = caps
-                    _LOGGER.debug(f'Cap Counter updated')
-                    return True
-            _LOGGER.error(f"Connection failed with {ble_device.name}")
+            if caps:
+                caps = int(round(caps))
+                result = await coordinator.async_command(
+                    lambda client: client.update_caps_counter(caps, deadline=deadline), deadline)
+                # Failed writes and missed deadlines come back as False
+                if result is not True:
+                    _LOGGER.error(f'Updating caps counter of {coordinator.mac} failed')
+                    return None
+                # No poll may have succeeded yet since a restart
+                coordinator.client.sensordata.setdefault(coordinator.mac, {})['caps_number'] = caps
+                coordinator.async_set_updated_data({**(coordinator.data or {}), 'caps_number': caps})
+                _LOGGER.debug(f'Cap Counter updated')
+                return True
+            return None
+        except NespressoConnectionError as e:
+            _LOGGER.error(e)
+            return None
+        except TimeoutError:
+            _LOGGER.error(f"Updating caps counter did not complete within {call.data.get('timeout')}s")
             return None
         except Exception as e:
             _LOGGER.exception("Updating caps counter failed: %s", e)
 
         return None
-    
+
+    async def water_hardness(call):
+        """Set the water hardness level"""
+        coordinator = _coordinator_for(hass, call)
+        deadline = _deadline(call)
+        try:
+            level = int(call.data.get('level'))
+        except (TypeError, ValueError):
+            _LOGGER.error(f"Water hardness level must be a number, got {call.data.get('level')!r}")
+            return None
+
+        try:
+            result = await coordinator.async_command(
+                lambda client: client.update_water_hardness(level, deadline=deadline), deadline)
+            # Failed writes and missed deadlines come back as False
+            if result is not True:
+                _LOGGER.error(f'Setting water hardness of {coordinator.mac} failed')
+                return None
+            _LOGGER.debug(f'Water hardness set to {level}')
+            return True
+        except NespressoConnectionError as e:
+            _LOGGER.error(e)
+        except TimeoutError:
+            _LOGGER.error(f"Setting water hardness did not complete within {call.data.get('timeout')}s")
+        except Exception as e:
+            _LOGGER.exception("Setting water hardness failed: %s", e)
+
+        return None
+
+    async def refresh_device_info(call):
+        """Re-read the cached device info from the machine"""
+        coordinator = _coordinator_for(hass, call)
+        try:
+            await coordinator.async_refresh_device_info()
+        except (NespressoConnectionError, UpdateFailed) as e:
+            _LOGGER.error(e)
 
     hass.services.async_register(DOMAIN, "coffee", brew)
     hass.services.async_register(DOMAIN, "caps", caps)
-    
-class NespressoSensor(Entity):
+    hass.services.async_register(DOMAIN, "water_hardness", water_hardness)
+    hass.services.async_register(DOMAIN, "refresh_device_info", refresh_device_info)
+
+
+@callback
+def async_remove_services(hass: HomeAssistant) -> None:
+    """Remove the services once the last machine is unloaded."""
+    for service in SERVICES:
+        hass.services.async_remove(DOMAIN, service)
+
+
+class NespressoSensor(CoordinatorEntity, RestoreEntity):
     """General Representation of an Nespresso sensor."""
-    def __init__(self, mac, auth, name, device, device_info, sensor_specifics, device_entry):
+    # Show the last known state until the machine has been read
+    _restore_state = True
+
+    def __init__(self, coordinator, mac, auth, name, device_info, sensor_specifics, device_entry):
         """Initialize a sensor."""
+        super().__init__(coordinator)
         self._device_entry = device_entry
-        self.device = device
         self._mac = mac
         self.auth = auth
         self._name = '{}-{}'.format(device_info, name)
@@ -209,6 +311,8 @@ class NespressoSensor(Entity):
         self._sensor_name = name
         self._device_class = sensor_specifics.device_class
         self._state = STATE_UNKNOWN
+        self._value = None
+        self._available = None
         self._sensor_specifics = sensor_specifics
 
     @property
@@ -262,32 +366,82 @@ class NespressoSensor(Entity):
         attributes = self._sensor_specifics.get_extra_attributes(self._state)
         return attributes
 
-    async def async_update(self) -> None:
-        """Fetch new state data for the sensor asynchronously.
-        This is the only method that should fetch new data for Home Assistant.
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Update the state from the latest coordinator snapshot.
+
+        Nothing is formatted or written unless this sensor's value or availability changed.
         """
-        now = datetime.now()
-        if self.device.data_last_updated is None or now - self.device.data_last_updated > SCAN_INTERVAL:
-            async with self.device.data_update_lock:
-                if self.device.data_last_updated is None or now - self.device.data_last_updated > SCAN_INTERVAL:
-                    try:
-                        ble_device = async_ble_device_from_address(self.hass, self._mac)
-                        conn_status = await self.device.connect(ble_device)
-                    except UnboundLocalError:
-                        raise ConfigEntryNotReady()
-
-                    await self.device.get_sensor_data()
-                    await self.device.disconnect()
-        value = self.device.sensordata[self._mac][self._sensor_name]
-
-        if type(value) is str:
-            self._state = ' '.join(word.capitalize() for word in value.split('_'))
-        elif self._sensor_specifics.unit_scale is None:
-            self._state = value
-        else:
-            self._state = round(float(value * self._sensor_specifics.unit_scale), 2)
-
-        end = datetime.now()
-        _LOGGER.debug(f'async_update() took {end - now}')
-        _LOGGER.debug("State {} {}".format(self._name, self._state))
-    
+        value = self._current_value()
+        available = self.available
+        if value == self._value and available == self._available:
+            return
+        self._available = available
+
+        if value is not None and value != self._value:
+            self._value = value
+            if type(value) is str:
+                self._state = ' '.join(word.capitalize() for word in value.split('_'))
+            elif self._sensor_specifics.unit_scale is None:
+                self._state = value
+            else:
+                self._state = round(float(value * self._sensor_specifics.unit_scale), 2)
+            _LOGGER.debug("State {} {}".format(self._name, self._state))
+
+        self.async_write_ha_state()
+
+    def _current_value(self):
+        data = self.coordinator.data
+        return data.get(self._sensor_name) if data else None
+
+    async def async_added_to_hass(self) -> None:
+        """Populate the initial state from the coordinator, or the last known state."""
+        await super().async_added_to_hass()
+        if self._restore_state and self._current_value() is None:
+            last_state = await self.async_get_last_state()
+            if last_state is not None and last_state.state not in (STATE_UNKNOWN, STATE_UNAVAILABLE):
+                self._state = last_state.state
+        self._handle_coordinator_update()
+
+
+class NespressoSignalSensor(NespressoSensor):
+    """Signal strength of the machine's advertisements, read without connecting."""
+    _restore_state = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    @property
+    def friendly_name(self):
+        """Return the friendly name of the sensor"""
+        return 'Signal Strength'
+
+    @property
+    def available(self):
+        """Available while the machine is advertising."""
+        return self.coordinator.present and self.coordinator.rssi is not None
+
+    def _current_value(self):
+        return self.coordinator.rssi
+
+
+class NespressoTimingSensor(NespressoSensor):
+    """Percentile of a connection or command phase, or a counter, from the client's timings."""
+    _restore_state = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, coordinator, mac, auth, name, device_info, sensor_specifics, device_entry, phase, percentile):
+        super().__init__(coordinator, mac, auth, name, device_info, sensor_specifics, device_entry)
+        self._phase = phase
+        self._percentile = percentile
+
+    @property
+    def available(self):
+        """Timings stay valid while the machine is unreachable."""
+        return True
+
+    def _current_value(self):
+        timings = self.coordinator.client.timings
+        if self._percentile is None:
+            return timings.counters.get(self._phase, 0)
+        return timings.percentile(self._phase, self._percentile)
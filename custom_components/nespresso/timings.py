@@ -0,0 +1,92 @@
+"""
+Rolling latency histograms of the phases of talking to a machine.
+
+Every phase (establishing the connection, pairing, authenticating, each GATT
+read, each command round trip, ...) keeps its last samples in a fixed size
+ring so percentiles reflect the current adapter and conditions. Counters track
+events that have no duration, like command retries.
+"""
+import time
+from array import array
+from contextlib import contextmanager
+
+DEFAULT_WINDOW = 100
+
+
+class RollingHistogram:
+    """The last `window` samples of one phase, in seconds."""
+
+    def __init__(self, window: int = DEFAULT_WINDOW) -> None:
+        self._samples = array('d', bytes(8 * window))
+        self._next = 0
+        self.count = 0
+        self.last: float | None = None
+
+    def add(self, seconds: float) -> None:
+        self._samples[self._next] = seconds
+        self._next = (self._next + 1) % len(self._samples)
+        self.count += 1
+        self.last = seconds
+
+    def samples(self) -> list:
+        """Samples still in the window, oldest first."""
+        if self.count < len(self._samples):
+            return self._samples[:self._next].tolist()
+        return (self._samples[self._next:] + self._samples[:self._next]).tolist()
+
+    def percentile(self, q: float) -> float | None:
+        """Nearest rank percentile (0-100) of the window, None without samples."""
+        samples = sorted(self.samples())
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+    def summary(self) -> dict:
+        samples = sorted(self.samples())
+        if not samples:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'last': self.last,
+            'p50': samples[min(len(samples) - 1, len(samples) // 2)],
+            'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            'max': samples[-1],
+        }
+
+
+class PhaseTimings:
+    def __init__(self, window: int = DEFAULT_WINDOW) -> None:
+        self.window = window
+        self.phases: dict = {}
+        self.counters: dict = {}
+
+    def record(self, phase: str, seconds: float) -> None:
+        if phase not in self.phases:
+            self.phases[phase] = RollingHistogram(self.window)
+        self.phases[phase].add(seconds)
+
+    @contextmanager
+    def measure(self, phase: str):
+        """Records how long the block took, whether it succeeded or not."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def increment(self, counter: str, amount: int = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def count(self, phase: str) -> int:
+        histogram = self.phases.get(phase)
+        return histogram.count if histogram is not None else 0
+
+    def percentile(self, phase: str, q: float) -> float | None:
+        histogram = self.phases.get(phase)
+        return histogram.percentile(q) if histogram is not None else None
+
+    def summary(self) -> dict:
+        return {
+            'phases': {phase: histogram.summary() for phase, histogram in self.phases.items()},
+            'counters': dict(self.counters),
+        }
@@ -0,0 +1,266 @@
+"""
+Extracts the ATT traffic of a Bluetooth pcapng capture.
+
+The capture is read one block at a time, so memory use doesn't grow with its
+size. HCI ACL packets are reassembled into L2CAP frames and the ATT PDUs in
+them are decoded. Characteristic discovery responses in the capture map handles
+to UUIDs, which are then named after the CHAR_UUID_* constants of the
+integration. Every read, write, notification and indication is listed and the
+frames the integration decodes can be written to a frame log for the
+decoder benchmarks and bench_replay.py.
+
+    python reverse_engineering/att_extract.py data/captures/nespresso_expert_pairing.pcapng
+    python reverse_engineering/att_extract.py capture.pcapng --framelog /tmp/frames
+
+Supports captures with link type 201 (HCI H4 with a direction header, e.g.
+Android btsnoop via Wireshark) and 187 (HCI H4).
+"""
+import argparse
+import os
+import struct
+import sys
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'nespresso'))
+
+import nespresso
+from framelog import CHARACTERISTIC_IDS, FrameRecorder
+
+BLOCK_SHB = 0x0A0D0D0A
+BLOCK_IDB = 0x00000001
+BLOCK_SPB = 0x00000003
+BLOCK_EPB = 0x00000006
+BYTE_ORDER_MAGIC = 0x1A2B3C4D
+OPTION_IF_TSRESOL = 9
+
+LINKTYPE_BLUETOOTH_HCI_H4 = 187
+LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR = 201
+
+H4_ACL = 0x02
+H4_EVENT = 0x04
+EVENT_DISCONNECTION_COMPLETE = 0x05
+L2CAP_CID_ATT = 0x0004
+
+ATT_ERROR_RSP = 0x01
+ATT_READ_BY_TYPE_REQ = 0x08
+ATT_READ_BY_TYPE_RSP = 0x09
+ATT_READ_REQ = 0x0A
+ATT_READ_RSP = 0x0B
+ATT_READ_BLOB_REQ = 0x0C
+ATT_READ_BLOB_RSP = 0x0D
+ATT_WRITE_REQ = 0x12
+ATT_WRITE_CMD = 0x52
+ATT_NOTIFICATION = 0x1B
+ATT_INDICATION = 0x1D
+GATT_CHARACTERISTIC = 0x2803
+
+BLUETOOTH_BASE_UUID = '0000{:04x}-0000-1000-8000-00805f9b34fb'
+
+# UUID -> constant name, first name wins where the integration reuses a UUID
+CHARACTERISTIC_NAMES = {}
+for _name in dir(nespresso):
+    if _name.startswith('CHAR_UUID_'):
+        CHARACTERISTIC_NAMES.setdefault(getattr(nespresso, _name), _name)
+
+
+@dataclass
+class AttOperation:
+    timestamp: float
+    connection: int
+    kind: str             # read, write, write_command, notify or indicate
+    handle: int
+    uuid: str | None
+    value: bytes
+
+    @property
+    def name(self) -> str | None:
+        return CHARACTERISTIC_NAMES.get(self.uuid)
+
+
+def format_uuid(raw: bytes) -> str:
+    if len(raw) == 2:
+        return BLUETOOTH_BASE_UUID.format(int.from_bytes(raw, 'little'))
+    value = raw[::-1].hex()
+    return f'{value[:8]}-{value[8:12]}-{value[12:16]}-{value[16:20]}-{value[20:]}'
+
+
+def read_packets(f):
+    """Yields (timestamp, link type, packet) of every packet of a pcapng file object."""
+    endian = '<'
+    interfaces = []
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        block_type = struct.unpack('<I', header[:4])[0]
+        if block_type == BLOCK_SHB:
+            magic = f.read(4)
+            endian = '<' if struct.unpack('<I', magic)[0] == BYTE_ORDER_MAGIC else '>'
+            length = struct.unpack(endian + 'I', header[4:])[0]
+            f.read(length - 12)
+            interfaces = []
+            continue
+
+        block_type, length = struct.unpack(endian + 'II', header)
+        body = f.read(length - 8)
+        if len(body) < length - 8:
+            return
+        body = body[:-4]
+        if block_type == BLOCK_IDB:
+            link_type = struct.unpack_from(endian + 'H', body)[0]
+            interfaces.append((link_type, _timestamp_resolution(body[8:], endian)))
+        elif block_type == BLOCK_EPB:
+            interface, high, low, captured = struct.unpack_from(endian + 'IIII', body)
+            link_type, resolution = interfaces[interface]
+            yield ((high << 32) | low) * resolution, link_type, body[20:20 + captured]
+        elif block_type == BLOCK_SPB and interfaces:
+            link_type = interfaces[0][0]
+            yield None, link_type, body[4:]
+
+
+def _timestamp_resolution(options: bytes, endian: str) -> float:
+    offset = 0
+    while offset + 4 <= len(options):
+        code, length = struct.unpack_from(endian + 'HH', options, offset)
+        if code == 0:
+            break
+        if code == OPTION_IF_TSRESOL and length >= 1:
+            value = options[offset + 4]
+            return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+        offset += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+
+class AttExtractor:
+    """Turns HCI packets into ATT operations, keeping state per connection."""
+
+    def __init__(self) -> None:
+        self.handles: dict = {}       # connection -> {value handle: UUID}
+        self._fragments: dict = {}    # (connection, direction) -> [expected length, data]
+        self._pending: dict = {}      # connection -> (opcode, handle or type)
+
+    def feed(self, timestamp, link_type: int, packet: bytes):
+        """Returns the ATT operations completed by this packet."""
+        direction = None
+        if link_type == LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR:
+            direction = struct.unpack_from('>I', packet)[0]
+            packet = packet[4:]
+        elif link_type != LINKTYPE_BLUETOOTH_HCI_H4:
+            return []
+        if not packet:
+            return []
+
+        if packet[0] == H4_EVENT and len(packet) >= 7 and packet[1] == EVENT_DISCONNECTION_COMPLETE:
+            connection = struct.unpack_from('<H', packet, 4)[0] & 0x0FFF
+            self._forget(connection)
+            return []
+        if packet[0] != H4_ACL or len(packet) < 5:
+            return []
+
+        handle_flags, length = struct.unpack_from('<HH', packet, 1)
+        connection = handle_flags & 0x0FFF
+        continuation = (handle_flags >> 12) & 0x3 == 0x1
+        data = packet[5:5 + length]
+        key = (connection, direction)
+
+        if continuation:
+            fragment = self._fragments.get(key)
+            if fragment is None:
+                return []
+            fragment[1] += data
+        else:
+            if len(data) < 4:
+                return []
+            fragment = self._fragments[key] = [struct.unpack_from('<H', data)[0] + 4, bytearray(data)]
+        if len(fragment[1]) < fragment[0]:
+            return []
+        del self._fragments[key]
+
+        frame = bytes(fragment[1][:fragment[0]])
+        if struct.unpack_from('<H', frame, 2)[0] != L2CAP_CID_ATT or len(frame) < 5:
+            return []
+        return self._att(timestamp, connection, frame[4:])
+
+    def _forget(self, connection: int) -> None:
+        self.handles.pop(connection, None)
+        self._pending.pop(connection, None)
+        for key in [key for key in self._fragments if key[0] == connection]:
+            del self._fragments[key]
+
+    def _operation(self, timestamp, connection, kind, handle, value) -> AttOperation:
+        uuid = self.handles.get(connection, {}).get(handle)
+        return AttOperation(timestamp, connection, kind, handle, uuid, bytes(value))
+
+    def _att(self, timestamp, connection: int, pdu: bytes) -> list:
+        opcode = pdu[0]
+        if opcode in (ATT_READ_REQ, ATT_READ_BLOB_REQ) and len(pdu) >= 3:
+            self._pending[connection] = (opcode, struct.unpack_from('<H', pdu, 1)[0])
+        elif opcode == ATT_READ_BY_TYPE_REQ and len(pdu) >= 7:
+            self._pending[connection] = (opcode, int.from_bytes(pdu[5:], 'little'))
+        elif opcode in (ATT_READ_RSP, ATT_READ_BLOB_RSP):
+            request, handle = self._pending.pop(connection, (None, None))
+            if request in (ATT_READ_REQ, ATT_READ_BLOB_REQ):
+                return [self._operation(timestamp, connection, 'read', handle, pdu[1:])]
+        elif opcode == ATT_READ_BY_TYPE_RSP and len(pdu) >= 2:
+            request, attribute_type = self._pending.pop(connection, (None, None))
+            if request == ATT_READ_BY_TYPE_REQ and attribute_type == GATT_CHARACTERISTIC:
+                self._characteristics(connection, pdu)
+        elif opcode == ATT_ERROR_RSP:
+            self._pending.pop(connection, None)
+        elif opcode in (ATT_WRITE_REQ, ATT_WRITE_CMD) and len(pdu) >= 3:
+            kind = 'write' if opcode == ATT_WRITE_REQ else 'write_command'
+            return [self._operation(timestamp, connection, kind, struct.unpack_from('<H', pdu, 1)[0], pdu[3:])]
+        elif opcode in (ATT_NOTIFICATION, ATT_INDICATION) and len(pdu) >= 3:
+            kind = 'notify' if opcode == ATT_NOTIFICATION else 'indicate'
+            return [self._operation(timestamp, connection, kind, struct.unpack_from('<H', pdu, 1)[0], pdu[3:])]
+        return []
+
+    def _characteristics(self, connection: int, pdu: bytes) -> None:
+        # Each entry: declaration handle, properties, value handle, UUID
+        entry_length = pdu[1]
+        if entry_length not in (7, 21):
+            return
+        handles = self.handles.setdefault(connection, {})
+        for offset in range(2, len(pdu) - entry_length + 1, entry_length):
+            value_handle = struct.unpack_from('<H', pdu, offset + 3)[0]
+            handles[value_handle] = format_uuid(pdu[offset + 5:offset + entry_length])
+
+    def extract(self, packets):
+        for timestamp, link_type, packet in packets:
+            yield from self.feed(timestamp, link_type, packet)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help='pcapng file')
+    parser.add_argument('--framelog', help='write the read and notified frames the integration decodes here')
+    parser.add_argument('--quiet', action='store_true', help="don't list every operation")
+    args = parser.parse_args()
+
+    recorder = FrameRecorder(args.framelog) if args.framelog else None
+    counts: dict = {}
+    recorded = 0
+    with open(args.capture, 'rb') as f:
+        for operation in AttExtractor().extract(read_packets(f)):
+            counts[operation.kind] = counts.get(operation.kind, 0) + 1
+            if not args.quiet:
+                name = operation.name or operation.uuid or 'unknown'
+                print(f'{operation.timestamp or 0:17.6f}  {operation.kind:<13} 0x{operation.handle:04x} '
+                      f'{name:<28} {operation.value.hex()}')
+            # Writes carry commands and the auth key rather than machine state
+            if (recorder is not None and operation.kind in ('read', 'notify', 'indicate')
+                    and operation.uuid in CHARACTERISTIC_IDS):
+                recorder.record(operation.uuid, operation.value, operation.timestamp)
+                recorded += 1
+                if recorded % 10000 == 0:
+                    recorder.flush()
+
+    if recorder is not None:
+        recorder.flush()
+        print(f'{recorded} frames written to {args.framelog}')
+    print(', '.join(f'{count} {kind}' for kind, count in sorted(counts.items())) or 'no ATT operations found')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+# The client modules import flat, the way the benchmarks use them, so the suite runs without Home Assistant
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'custom_components', 'nespresso'))
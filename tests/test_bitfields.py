@@ -0,0 +1,32 @@
+import pytest
+
+from bitfields import Layout, bit, bits, byte_range
+from enums import MachineState
+
+
+def test_bit_addresses_bytes_from_their_least_significant_bit():
+    layout = Layout(bit('low', 0, 0), bit('high', 0, 7), bit('second', 1, 2))
+    assert layout.decode(b'\x01\x00') == {'low': True, 'high': False, 'second': False}
+    assert layout.decode(b'\x80\x04') == {'low': False, 'high': True, 'second': True}
+
+
+def test_bits_count_from_the_most_significant_bit_across_bytes():
+    layout = Layout(bits('nibble', 4, 4), bits('spanning', 6, 6))
+    assert layout.decode(b'\x0b\xf0') == {'nibble': 0xb, 'spanning': 0b111111}
+
+
+def test_byte_range_is_big_endian_and_clipped():
+    layout = Layout(byte_range('counter', 1, 3), byte_range('rest', 2), byte_range('all', 0))
+    assert layout.decode(b'\x01\x02\x03\x04') == {'counter': 0x0203, 'rest': 0x0304, 'all': 0x01020304}
+    assert layout.decode(b'\x01\x02') == {'counter': 0x02, 'rest': 0, 'all': 0x0102}
+
+
+def test_enum_fields_decode_to_member_names():
+    layout = Layout(bits('state', 4, 4, MachineState), byte_range('doubled', 1, 2, lambda value: value * 2))
+    assert layout.decode(b'\x02\x05') == {'state': 'READY', 'doubled': 10}
+
+
+def test_unknown_enum_values_raise_value_error():
+    layout = Layout(bits('state', 0, 5, MachineState))
+    with pytest.raises(ValueError, match='31 is not a valid MachineState'):
+        layout.decode(b'\xf8')
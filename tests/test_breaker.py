@@ -0,0 +1,62 @@
+import random
+
+from breaker import CircuitBreaker
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_opens_after_threshold_failures():
+    clock = Clock()
+    breaker = CircuitBreaker(base_delay=60, threshold=3, jitter=0, clock=clock)
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.record_failure()
+    assert breaker.is_open
+    assert not breaker.allow()
+    assert breaker.retry_in == 60
+
+    clock.now += 60
+    assert breaker.allow()
+
+
+def test_backoff_doubles_up_to_max_delay():
+    clock = Clock()
+    breaker = CircuitBreaker(base_delay=60, max_delay=900, threshold=1, jitter=0, clock=clock)
+    delays = []
+    for _ in range(6):
+        breaker.record_failure()
+        delays.append(breaker.retry_in)
+    assert delays == [60, 120, 240, 480, 900, 900]
+
+
+def test_only_the_opening_failure_reports_it():
+    breaker = CircuitBreaker(threshold=2, clock=Clock())
+    assert [breaker.record_failure() for _ in range(4)] == [False, True, False, False]
+
+
+def test_jitter_shortens_the_backoff():
+    random.seed(0)
+    clock = Clock()
+    breaker = CircuitBreaker(base_delay=100, threshold=1, jitter=0.25, clock=clock)
+    for _ in range(50):
+        breaker.reset()
+        breaker.record_failure()
+        assert 75 <= breaker.retry_in <= 100
+
+
+def test_success_and_reset_close_the_breaker():
+    breaker = CircuitBreaker(threshold=1, clock=Clock())
+    breaker.record_failure()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow()
+
+    breaker.record_failure()
+    breaker.reset()
+    assert breaker.failures == 0 and breaker.retry_in == 0
@@ -0,0 +1,109 @@
+import asyncio
+
+from machines import BrewType
+from nespresso import NespressoClient
+from simulator import SimulatedNespresso
+
+AUTH_KEY = 'e37d7534af63435d'
+
+
+def simulated(**kwargs):
+    machine = SimulatedNespresso(auth_key=AUTH_KEY, brew_duration=0, seed=0, **kwargs)
+    client = NespressoClient(AUTH_CODE=AUTH_KEY, mac=machine.address, connector=machine.establish_connection)
+    client.isOnboard = True
+    return machine, client
+
+
+def test_cancelled_connect_closes_its_link():
+    async def run():
+        machine, client = simulated()
+        connecting = asyncio.create_task(client.connect(machine.device))
+        # Cancelled during the settle sleep after pairing, as a preempted poll would be
+        await asyncio.sleep(0.1)
+        connecting.cancel()
+        await asyncio.gather(connecting, return_exceptions=True)
+        assert machine.clients == []
+
+        # Past a deadline, as a command with a timeout would be
+        await asyncio.gather(asyncio.wait_for(client.connect(machine.device), 0.1), return_exceptions=True)
+        assert machine.clients == []
+        client.bonded = True
+        assert await client.connect(machine.device)
+        return len(machine.clients)
+
+    assert asyncio.run(run()) == 1
+
+
+def test_polls_and_brews():
+    async def run():
+        machine, client = simulated()
+        client.bonded = True
+        async with client.session(machine.device):
+            await client.get_info()
+            await client.get_sensors()
+            data = (await client.get_sensor_data())[machine.address]
+            assert data['state'] == 'READY' and data['caps_number'] == 100
+            assert await client.brew_predefined(BrewType.LUNGO) == 'Done'
+            assert await client.update_caps_counter(42) is True
+            machine.slider_closed = False
+            assert await client.brew_predefined(BrewType.LUNGO) == 'Slider Open'
+        await client.disconnect()
+        return machine.caps_number, machine.clients
+
+    assert asyncio.run(run()) == (42, [])
+
+
+def test_wrong_auth_key_fails_the_connect():
+    async def run():
+        machine, _ = simulated()
+        client = NespressoClient(AUTH_CODE='0000000000000000', mac=machine.address,
+                                 connector=machine.establish_connection)
+        client.isOnboard = True
+        client.bonded = True
+        return await client.connect(machine.device), client.is_connected, machine.clients
+
+    assert asyncio.run(run()) == (False, False, [])
+
+
+def test_reconnects_after_the_link_dropped():
+    async def run():
+        machine, client = simulated()
+        client.bonded = True
+        async with client.session(machine.device):
+            await client.get_info()
+            await client.get_sensors()
+        machine.clients[0].drop()
+        assert not client.is_connected
+        async with client.session(machine.device):
+            data = await client.get_sensor_data()
+        return data[machine.address]['state'], machine.counters['connects']
+
+    assert asyncio.run(run()) == ('READY', 2)
+
+
+def test_poll_reads_in_one_round_trip():
+    async def run():
+        machine, client = simulated(latency=0.001)
+        client.bonded = True
+        async with client.session(machine.device):
+            await client.get_info()
+            sensors = await client.get_sensors()
+            machine.counters['max_in_flight'] = 0
+            await client.get_sensor_data()
+            return machine.counters['max_in_flight'], len(sensors[machine.address])
+
+    # The characteristics are read concurrently rather than one after the other
+    in_flight, characteristics = asyncio.run(run())
+    assert in_flight == characteristics > 1
+
+
+def test_failed_identity_read_returns_none():
+    async def run():
+        machine, client = simulated()
+        client.bonded = True
+        async with client.session(machine.device):
+            assert machine.address in await client.get_info()
+            machine.packet_loss = 1.0
+            return await client.get_info()
+
+    assert asyncio.run(run()) is None
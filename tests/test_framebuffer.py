@@ -0,0 +1,19 @@
+from framebuffer import FrameRing
+
+
+def test_keeps_the_last_frames_oldest_first():
+    ring = FrameRing(capacity=3, frame_size=4)
+    assert len(ring) == 0 and ring.frames() == []
+    for i in range(5):
+        ring.append(bytes([i] * (i % 4 + 1)), timestamp=float(i))
+
+    assert len(ring) == 3
+    assert ring.count == 5
+    assert ring.frames() == [(2.0, b'\x02\x02\x02'), (3.0, b'\x03\x03\x03\x03'), (4.0, b'\x04')]
+
+
+def test_truncates_long_frames():
+    ring = FrameRing(capacity=2, frame_size=4)
+    ring.append(bytearray(b'abcdefgh'), timestamp=1.0)
+    ring.append(memoryview(b'xy'), timestamp=2.0)
+    assert ring.frames() == [(1.0, b'abcd'), (2.0, b'xy')]
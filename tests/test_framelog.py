@@ -0,0 +1,54 @@
+import os
+
+from framelog import RECORD, FrameLog, FrameRecorder
+from nespresso import CHAR_UUID_CMDRESP, CHAR_UUID_NBCAPS, CHAR_UUID_STATE
+
+
+def record(directory, count, segment_size=4096):
+    recorder = FrameRecorder(str(directory), segment_size=segment_size)
+    frames = []
+    for i in range(count):
+        char_uuid = CHAR_UUID_STATE if i % 3 else CHAR_UUID_NBCAPS
+        frame = i.to_bytes(4, 'big')
+        recorder.record(char_uuid, frame, timestamp=1_700_000_000 + i)
+        frames.append((1_700_000_000 + i, char_uuid, frame))
+    recorder.flush()
+    return frames
+
+
+def test_round_trip(tmp_path):
+    frames = record(tmp_path, 200)
+    assert [(t, c, bytes(f)) for t, c, f in FrameLog(str(tmp_path)).scan()] == frames
+
+
+def test_unknown_characteristics_are_not_recorded(tmp_path):
+    recorder = FrameRecorder(str(tmp_path))
+    recorder.record('00000000-0000-0000-0000-000000000000', b'\x01', timestamp=1.0)
+    recorder.record(CHAR_UUID_CMDRESP, b'\x02', timestamp=2.0)
+    recorder.flush()
+    assert [(t, c) for t, c, _ in FrameLog(str(tmp_path)).scan()] == [(2.0, CHAR_UUID_CMDRESP)]
+
+
+def test_scan_seeks_and_filters(tmp_path):
+    frames = record(tmp_path, 500, segment_size=2048)
+    log = FrameLog(str(tmp_path))
+    assert len(log.segments()) > 1
+
+    start, end = 1_700_000_000 + 150, 1_700_000_000 + 420
+    scanned = [(t, c, bytes(f)) for t, c, f in log.scan(start, end, [CHAR_UUID_NBCAPS])]
+    assert scanned == [frame for frame in frames if start <= frame[0] <= end and frame[1] == CHAR_UUID_NBCAPS]
+
+
+def test_segments_roll_over_at_their_size(tmp_path):
+    record(tmp_path, 300, segment_size=1024)
+    segments = FrameLog(str(tmp_path)).segments()
+    assert len(segments) > 1
+    assert all(os.path.getsize(path + '.seg') <= 1024 for path in segments)
+
+
+def test_torn_write_is_skipped(tmp_path):
+    frames = record(tmp_path, 10)
+    (segment,) = FrameLog(str(tmp_path)).segments()
+    with open(segment + '.seg', 'ab') as f:
+        f.write(RECORD.pack(1_700_000_100, 1, 8) + b'\x00')
+    assert len(list(FrameLog(str(tmp_path)).scan())) == len(frames)
@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from operations import PRIORITY_COMMAND, PRIORITY_POLL, OperationQueue
+
+
+def test_commands_run_before_queued_polls():
+    async def run():
+        queue = OperationQueue('test')
+        order = []
+
+        async def operation(name):
+            order.append(name)
+            await asyncio.sleep(0)
+            return name
+
+        first = asyncio.create_task(queue.submit(lambda: operation('first poll'), PRIORITY_POLL))
+        await asyncio.sleep(0)
+        results = await asyncio.gather(
+            first,
+            queue.submit(lambda: operation('second poll'), PRIORITY_POLL),
+            queue.submit(lambda: operation('command'), PRIORITY_COMMAND))
+        assert results == ['first poll', 'second poll', 'command']
+        return order
+
+    assert asyncio.run(run()) == ['first poll', 'command', 'second poll']
+
+
+def test_waiting_operations_with_the_same_key_collapse():
+    async def run():
+        queue = OperationQueue('test')
+        calls = []
+
+        async def blocker():
+            await asyncio.sleep(0.01)
+
+        async def poll():
+            calls.append(1)
+            return len(calls)
+
+        running = asyncio.create_task(queue.submit(blocker))
+        await asyncio.sleep(0)
+        results = await asyncio.gather(*(queue.submit(poll, PRIORITY_POLL, key='poll') for _ in range(3)))
+        await running
+        return results, calls
+
+    results, calls = asyncio.run(run())
+    assert results == [1, 1, 1]
+    assert len(calls) == 1
+
+
+def test_command_preempts_and_requeues_a_running_poll():
+    async def run():
+        queue = OperationQueue('test')
+        started = []
+
+        async def poll():
+            started.append('poll')
+            queue.mark_preemptible()
+            await asyncio.sleep(0.05)
+            return 'polled'
+
+        async def command():
+            started.append('command')
+            return 'done'
+
+        poll_result = asyncio.create_task(queue.submit(poll, PRIORITY_POLL, key='poll'))
+        await asyncio.sleep(0.01)
+        assert await queue.submit(command) == 'done'
+        return await poll_result, started
+
+    result, started = asyncio.run(run())
+    assert result == 'polled'
+    assert started == ['poll', 'command', 'poll']
+
+
+def test_poll_is_not_preempted_before_it_marks_itself():
+    async def run():
+        queue = OperationQueue('test')
+        events = []
+
+        async def poll():
+            events.append('connecting')
+            await asyncio.sleep(0.02)
+            events.append('connected')
+            # The command queued while connecting takes over from here
+            queue.mark_preemptible()
+            await asyncio.sleep(0)
+            events.append('polled')
+
+        async def command():
+            events.append('command')
+
+        poll_result = asyncio.create_task(queue.submit(poll, PRIORITY_POLL, key='poll'))
+        await asyncio.sleep(0.01)
+        await queue.submit(command)
+        await poll_result
+        return events
+
+    assert asyncio.run(run()) == ['connecting', 'connected', 'command', 'connecting', 'connected', 'polled']
+
+
+def test_errors_reach_the_caller():
+    async def run():
+        async def fail():
+            raise ValueError('boom')
+
+        await OperationQueue('test').submit(fail)
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+
+
+def test_shutdown_cancels_the_running_operation_for_its_callers():
+    async def run():
+        queue = OperationQueue('test')
+        cancelled = asyncio.Event()
+
+        async def slow_poll():
+            try:
+                await asyncio.sleep(10)
+            finally:
+                cancelled.set()
+
+        waiting = asyncio.create_task(queue.submit(slow_poll, PRIORITY_POLL, key='poll'))
+        queued = asyncio.create_task(queue.submit(slow_poll, PRIORITY_POLL))
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(queue.shutdown(), 1)
+        assert cancelled.is_set()
+        for task in (waiting, queued):
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.wait_for(task, 1)
+
+    asyncio.run(run())